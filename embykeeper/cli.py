@@ -116,7 +116,28 @@ def main(
     ),
     follow: bool = typer.Option(False, "--follow", "-f", rich_help_panel="调试 参数", help="仅启动消息调试"),
     analyze: bool = typer.Option(False, "--analyze", "-a", rich_help_panel="调试 参数", help="仅启动历史信息分析"),
+    workers: int = typer.Option(
+        1, "--workers", "-w", min=1, rich_help_panel="参数", help="按账号分片到多个进程运行"
+    ),
+    benchmark: Path = typer.Option(
+        None,
+        "--benchmark",
+        "-b",
+        file_okay=False,
+        exists=True,
+        rich_help_panel="调试 参数",
+        help="仅对已标注的验证码目录进行识别测试",
+    ),
 ):
+    if benchmark:
+        import asyncio
+
+        from .telechecker.main import benchmarker
+
+        config = prepare_config(config) if config else {}
+        if config is None:
+            raise typer.Exit()
+        return asyncio.run(benchmarker(config, benchmark))
     config = prepare_config(config)
     if not config:
         raise typer.Exit()
@@ -133,13 +154,11 @@ def main(
     logger.info(f'当前版本 ({__version__}) 活跃贡献者: {", ".join(__author__)}.')
 
     import asyncio
-    from datetime import datetime
 
-    import schedule
-    from dateutil import parser
+    from .telechecker.main import analyzer, follower
+    from .telechecker.tele import ClientsSession
 
-    from .embywatcher.main import watcher
-    from .telechecker.main import analyzer, checkiner, follower, messager, monitorer
+    ClientsSession.shared = config.get("shared_session", False)
 
     if follow:
         return asyncio.run(follower(config))
@@ -152,8 +171,27 @@ def main(
         timerange = timerange.split("-") if timerange else []
         limit = typer.prompt(indent + "请输入各群组最大获取数量", default=1000, type=int)
         return asyncio.run(analyzer(config, chats, keywords, timerange, limit))
+    if workers > 1:
+        from .supervisor import supervise
+
+        return supervise(config, workers, checkin=checkin, monitor=monitor, send=send, emby=emby, instant=instant)
+    run(config, checkin=checkin, monitor=monitor, send=send, emby=emby, instant=instant)
+
+
+def run(config, checkin=None, monitor=False, send=False, emby=0, instant=True):
+    import asyncio
+    from datetime import date, datetime, timedelta
+
+    import schedule
+    from dateutil import parser
+
+    from .embywatcher.main import watcher
+    from .telechecker.main import checkiner, messager, monitorer, warmer
+    from .telechecker.tele import ClientsSession
 
     loop = asyncio.new_event_loop()
+    ClientsSession.keepalive = 600
+    ClientsSession.shared = config.get("shared_session", False)
 
     def stop_loop():
         try:
@@ -161,6 +199,7 @@ def main(
             for t in tasks:
                 t.cancel()
             loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            loop.run_until_complete(ClientsSession.shutdown())
             loop.run_until_complete(loop.shutdown_asyncgens())
             loop.run_until_complete(loop.shutdown_default_executor())
         finally:
@@ -208,10 +247,15 @@ def main(
     if checkin:
         schedule_checkin = schedule.Scheduler()
         loop.create_task(run_pending_async(schedule_checkin))
-        checkin = parser.parse(checkin).time().strftime("%H:%M:%S")
-        schedule_checkin.every().day.at(checkin).do(lambda: loop.create_task(checkiner(config)))
+        checkin = parser.parse(checkin).time()
+        job = schedule_checkin.every().day.at(checkin.strftime("%H:%M:%S"))
+        job.do(lambda: loop.create_task(checkiner(config)))
+        warmup = config.get("ocr", {}).get("warmup", 5)
+        if warmup:
+            warmup = (datetime.combine(date.today(), checkin) - timedelta(minutes=warmup)).time()
+            schedule_checkin.every().day.at(warmup.strftime("%H:%M:%S")).do(lambda: loop.create_task(warmer(config)))
         logger.bind(scheme="telechecker").info(
-            f"下一次签到将在 {schedule_checkin.next_run.strftime('%m-%d %H:%M %p')} 进行."
+            f"下一次签到将在 {job.next_run.strftime('%m-%d %H:%M %p')} 进行."
         )
     if send:
         schedule_send = schedule.Scheduler()
@@ -10,10 +10,24 @@ def check_config(config):
             Optional("timeout"): PositiveInt(),
             Optional("retries"): PositiveInt(),
             Optional("concurrent"): PositiveInt(),
+            Optional("bot_concurrent"): PositiveInt(),
             Optional("random"): PositiveInt(),
             Optional("nofail"): bool,
-            Optional("captcha_service"): Use(str),
-            Optional("captcha_service_key"): Use(str),
+            Optional("shared_session"): bool,
+            Optional("captcha_service"): Or(str, [str]),
+            Optional("captcha_service_key"): Or({str: Use(str)}, Use(str)),
+            Optional("captcha_hedge"): And(Use(float), lambda n: n >= 0),
+            Optional("ocr"): Schema(
+                {
+                    Optional("workers"): PositiveInt(),
+                    Optional("process"): bool,
+                    Optional("threads"): PositiveInt(),
+                    Optional("warmup"): And(Use(int), lambda n: n >= 0),
+                    Optional("cache"): And(Use(int), lambda n: n >= 0),
+                    Optional("cache_ttl"): PositiveInt(),
+                    Optional("candidates"): PositiveInt(),
+                }
+            ),
             Optional("proxy"): Schema(
                 {
                     Optional("hostname"): Regex(
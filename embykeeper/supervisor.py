@@ -0,0 +1,91 @@
+import multiprocessing as mp
+import threading
+import traceback
+import zlib
+from collections import Counter
+
+from loguru import logger
+
+"""
+多进程运行: 按账号稳定哈希将 Telegram 与 Emby 账号分片到多个工作进程, 汇总日志与退出结果.
+"""
+
+
+def shard(config, workers: int):
+    shards = [dict(config, telegram=[], emby=[], worker=i) for i in range(workers)]
+    for a in config.get("telegram", []):
+        shards[zlib.crc32(str(a["phone"]).encode()) % workers]["telegram"].append(a)
+    for a in config.get("emby", []):
+        shards[zlib.crc32(f'{a["url"]}|{a["username"]}'.encode()) % workers]["emby"].append(a)
+    return shards
+
+
+def _worker(config, options, queue):
+    from .cli import _formatter, run
+
+    prefix = f"[gray50]#{config['worker']}[/] "
+
+    def sink(message):
+        record = message.record
+        text = prefix + str(message).rstrip("\n")
+        if record["exception"]:
+            text += "\n" + "".join(traceback.format_exception(*record["exception"])).rstrip("\n")
+        queue.put((record["level"].name, text))
+
+    logger.remove()
+    logger.add(sink, format=_formatter)
+    try:
+        run(config, **options)
+    except KeyboardInterrupt:
+        pass
+
+
+def _relay(queue):
+    while True:
+        item = queue.get()
+        if item is None:
+            break
+        level, text = item
+        logger.log(level, text)
+
+
+def supervise(config, workers: int, **options):
+    from rich.console import Console
+    from rich.table import Table
+
+    from .telechecker.ledger import Ledger
+
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    relay = threading.Thread(target=_relay, args=(queue,), daemon=True)
+    relay.start()
+    shards = [s for s in shard(config, workers) if s["telegram"] or s["emby"]]
+    logger.info(f"将以 {len(shards)} 个进程运行 ({len(config.get('telegram', []))} 个 Telegram 账号, {len(config.get('emby', []))} 个 Emby 账号).")
+    procs = []
+    for s in shards:
+        p = ctx.Process(target=_worker, args=(s, options, queue), name=f"worker-{s['worker']}")
+        p.start()
+        procs.append((s, p))
+    try:
+        for _, p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        for _, p in procs:
+            p.join()
+    finally:
+        queue.put(None)
+        relay.join(timeout=5)
+
+    table = Table("进程", "Telegram", "Emby", "今日签到成功", "退出码", header_style="bold magenta")
+    ledger = Ledger()
+    for s, p in procs:
+        results = Counter(e["result"] for a in s["telegram"] for e in ledger.today(a["phone"]))
+        table.add_row(
+            f"#{s['worker']}",
+            str(len(s["telegram"])),
+            str(len(s["emby"])),
+            f"{results[True]}/{results[True] + results[False]}",
+            str(p.exitcode),
+            style=None if p.exitcode == 0 else "red",
+        )
+    Console(stderr=True).print(table)
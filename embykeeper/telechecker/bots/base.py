@@ -4,19 +4,23 @@ from abc import ABC, abstractmethod
 from contextlib import asynccontextmanager, suppress
 from enum import Flag, auto
 
-import ddddocr
 from loguru import logger
-from PIL import Image
-from pyrogram import filters
 from pyrogram.errors import UsernameNotOccupied
-from pyrogram.handlers import EditedMessageHandler, MessageHandler
-from pyrogram.types import InlineKeyboardMarkup, Message, ReplyKeyboardMarkup
+from pyrogram.types import Chat, InlineKeyboardMarkup, Message, ReplyKeyboardMarkup, User
 from thefuzz import fuzz
 
-from ...utils import AsyncCountPool, to_iterable
+from ...utils import to_iterable
+from ..ocr import ocr
 from ..tele import Client
 
-ocr = ddddocr.DdddOcr(beta=True, show_ad=False)
+
+KEYWORDS = {
+    "fail": ("失败", "错误", "超时"),
+    "success": ("成功", "通过", "完成"),
+    "checked": ("只能", "已经", "下次", "过了", "签过"),
+}
+
+DIGITS = re.compile(r"\d+")
 
 
 class MessageType(Flag):
@@ -29,16 +33,36 @@ class MessageType(Flag):
 class BaseBotCheckin(ABC):
     name = __name__
 
-    def __init__(self, client: Client, retries=10, timeout=60, nofail=True, captcha_service='disabled', captcha_service_key='empty'):
+    def __init__(
+        self,
+        client: Client,
+        retries=10,
+        timeout=60,
+        nofail=True,
+        captcha_service="disabled",
+        captcha_service_key="empty",
+        captcha_hedge=None,
+    ):
         self.client = client
         self.retries = retries
         self.timeout = timeout
         self.nofail = nofail
         self.captcha_service = captcha_service
         self.captcha_service_key = captcha_service_key
+        self.captcha_hedge = captcha_hedge
+        self.points = None
         self.finished = asyncio.Event()
         self.log = logger.bind(scheme="telechecker", name=self.name, username=self.client.me.first_name)
 
+    def __init_subclass__(cls, **kw):
+        super().__init_subclass__(**kw)
+        cls.compile()
+
+    @classmethod
+    def compile(cls):
+        """在类创建时预编译匹配规则."""
+        pass
+
     async def _start(self):
         try:
             return await self.start()
@@ -53,9 +77,12 @@ class BaseBotCheckin(ABC):
     async def start(self):
         pass
 
+    def prefetch(self, wait=0, limit=None):
+        """在 wait 秒后开始签到前, 提前准备签到所需资源, 同一机器人最多同时准备 limit 份."""
+        pass
+
 
 class BotCheckin(BaseBotCheckin):
-    group_pool = AsyncCountPool(base=1000)
     bot_id = None
     bot_username = None
     bot_checkin_cmd = ["/checkin"]
@@ -64,31 +91,38 @@ class BotCheckin(BaseBotCheckin):
     bot_captcha_len = range(2, 7)
     bot_success_pat = r"(\d+)[^\d]*(\d+)"
     bot_use_history = None
+    bot_reply_timeout = 5
     chat_name = None
 
     def __init__(self, *args, **kw):
         super().__init__(*args, **kw)
         self._is_archived = False
         self._retries = 0
+        self._captcha = None
+        self._captcha_key = None
+        self._candidates = {}
+        self._replied = asyncio.Event()
+
+    @classmethod
+    def compile(cls):
+        cls._success_re = re.compile(cls.bot_success_pat)
+        cls._caption_re = re.compile(cls.bot_checkin_caption_pat) if cls.bot_checkin_caption_pat else None
+        groups = {"ignore": to_iterable(cls.bot_text_ignore), **KEYWORDS}
+        alts = [f"(?P<{k}>{'|'.join(re.escape(w) for w in v)})" for k, v in groups.items() if v]
+        cls._keywords_re = re.compile(f"(?=(?:{'|'.join(alts)}))")
+
+    def classify(self, text: str):
+        """返回文本中优先级最高的关键词类别: ignore, fail, success, checked 或 None."""
+        found = {m.lastgroup for m in self._keywords_re.finditer(text)}
+        return next((k for k in ("ignore", *KEYWORDS) if k in found), None)
 
     @asynccontextmanager
-    async def listener(self):
-        filter = filters.user(self.bot_id or self.bot_username)
-        if self.chat_name:
-            filter = filter & filters.chat(self.chat_name)
-        handlers = [
-            MessageHandler(self._message_handler, filter),
-            EditedMessageHandler(self._message_handler, filter),
-        ]
-        group = await BotCheckin.group_pool.append(handlers)
-        for h in handlers:
-            self.client.add_handler(h, group=group)
-        yield
-        for h in handlers:
-            try:
-                self.client.remove_handler(h, group=group)
-            except ValueError:
-                pass
+    async def listener(self, bot: User, chat: Chat):
+        self.client.router.add(chat.id, bot.id, self._message_handler)
+        try:
+            yield
+        finally:
+            self.client.router.remove(chat.id, bot.id, self._message_handler)
 
     async def wait_finished(self, chat):
         await self.finished.wait()
@@ -98,22 +132,19 @@ class BotCheckin(BaseBotCheckin):
     async def start(self):
         ident = self.chat_name or self.bot_id or self.bot_username
         try:
-            chat = await self.client.get_chat(ident)
+            chat = await self.client.cache.get_chat(ident)
         except UsernameNotOccupied:
             self.log.warning(f'初始化错误: 会话 "{ident}" 不存在.')
             return False
-        async for d in self.client.get_dialogs(folder_id=1):
-            if d.chat.id == chat.id:
-                self._is_archived = True
-                break
-        bot = await self.client.get_users(self.bot_id or self.bot_username)
+        self._is_archived = chat.id in await self.client.get_archived()
+        bot = await self.client.cache.get_user(self.bot_id or self.bot_username)
         msg = f"开始执行签到: [green]{bot.first_name}[/] [gray50](@{bot.username})[/]"
         if chat.title:
             msg += f" @ [green]{chat.title}[/] [gray50](@{chat.username})[/]"
         self.log.info(msg + ".")
         asyncio.create_task(self.wait_finished(chat))
         try:
-            async with self.listener():
+            async with self.listener(bot, chat):
                 if self.bot_use_history is None:
                     await self.send_checkin()
                 elif not await self.walk_history(self.bot_use_history):
@@ -140,17 +171,26 @@ class BotCheckin(BaseBotCheckin):
 
     async def send(self, cmd):
         if self.chat_name:
-            bot = await self.client.get_users(self.bot_id or self.bot_username)
+            bot = await self.client.cache.get_user(self.bot_id or self.bot_username)
             await self.client.send_message(self.chat_name, f"{cmd}@{bot.username}")
         else:
             await self.client.send_message(self.bot_id or self.bot_username, cmd)
 
     async def send_checkin(self):
-        for cmd in to_iterable(self.bot_checkin_cmd):
+        cmds = list(to_iterable(self.bot_checkin_cmd))
+        for i, cmd in enumerate(cmds):
+            self._replied.clear()
             await self.send(cmd)
-            await asyncio.sleep(5)
+            if i < len(cmds) - 1:
+                await self.wait_reply()
+
+    async def wait_reply(self, timeout=None):
+        """等待机器人回复, 超时 (默认 bot_reply_timeout 秒) 后直接返回."""
+        with suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(self._replied.wait(), timeout or self.bot_reply_timeout)
 
     async def _message_handler(self, *args, **kw):
+        self._replied.set()
         try:
             await self.message_handler(*args, **kw)
         except OSError as e:
@@ -175,8 +215,8 @@ class BotCheckin(BaseBotCheckin):
     def message_type(self, message: Message):
         if message.photo:
             if message.caption:
-                if self.bot_checkin_caption_pat:
-                    if re.search(self.bot_checkin_caption_pat, message.caption):
+                if self._caption_re:
+                    if self._caption_re.search(message.caption):
                         return MessageType.CAPTCHA
                     else:
                         return MessageType.CAPTION
@@ -186,40 +226,70 @@ class BotCheckin(BaseBotCheckin):
                 return MessageType.CAPTCHA
         elif message.text:
             return MessageType.TEXT
+        return MessageType(0)
 
     async def on_photo(self, message: Message):
         data = await self.client.download_media(message, in_memory=True)
-        image = Image.open(data)
-        captcha = ocr.classification(image).replace(" ", "")
-        if len(captcha) not in to_iterable(self.bot_captcha_len):
+        key = await ocr.fingerprint(data)
+        candidates = {}
+        for c in await ocr.rank(data, key=key):
+            candidates.setdefault(self.clean_captcha(c.text), c.text)
+        self._captcha_key = key
+        self._candidates = {c: t for c, t in candidates.items() if len(c) in to_iterable(self.bot_captcha_len)}
+        if not self._candidates:
+            captcha, text = next(iter(candidates.items()), ("", ""))
             self.log.info(f'验证码 "{captcha}" 低于设定长度, 正在重试.')
+            ocr.feedback(key, text, False)
             await self.retry()
         else:
-            await asyncio.sleep(1)
+            captcha = next(iter(self._candidates))
+            if captcha != next(iter(candidates)):
+                self.log.debug(f'验证码 "{next(iter(candidates))}" 长度不符, 使用候选结果 "{captcha}".')
+            self.use_captcha(captcha)
             await self.on_captcha(message, captcha)
 
+    @classmethod
+    def clean_captcha(cls, text: str):
+        return text.replace(" ", "")
+
+    def captcha_candidates(self, captcha: str):
+        return list(self._candidates) or [captcha]
+
+    def use_captcha(self, captcha: str):
+        self._captcha = (self._captcha_key, self._candidates.get(captcha, captcha))
+
     async def on_captcha(self, message: Message, captcha: str):
         self.log.debug(f"接收到验证码: {captcha}")
         await message.reply(captcha)
 
+    def captcha_feedback(self, accepted: bool):
+        if self._captcha:
+            ocr.feedback(*self._captcha, accepted)
+            self._captcha = None
+
     async def on_text(self, message: Message, text: str):
-        if any(s in text for s in to_iterable(self.bot_text_ignore)):
+        kind = self.classify(text)
+        if kind == "ignore":
             pass
-        elif any(s in text for s in ("失败", "错误", "超时")):
+        elif kind == "fail":
             self.log.info(f"签到失败, 正在重试.")
+            self.captcha_feedback(False)
             await self.retry()
-        elif any(s in text for s in ("成功", "通过", "完成")):
-            matches = re.search(self.bot_success_pat, text)
+        elif kind == "success":
+            self.captcha_feedback(True)
+            matches = self._success_re.search(text)
             if matches:
+                self.points = int(matches.group(2))
                 self.log.info(f"[yellow]签到成功[/]: + {matches.group(1)} 分 -> {matches.group(2)} 分.")
             else:
-                matches = re.search(r"\d+", text)
+                matches = DIGITS.search(text)
                 if matches:
+                    self.points = int(matches.group(0))
                     self.log.info(f"[yellow]签到成功[/]: 当前 {matches.group(0)} 分.")
                 else:
                     self.log.info(f"[yellow]签到成功[/].")
             self.finished.set()
-        elif any(s in text for s in ("只能", "已经", "下次", "过了", "签过")):
+        elif kind == "checked":
             self.log.info(f"今日已经签到过了.")
             self.finished.set()
         else:
@@ -228,7 +298,6 @@ class BotCheckin(BaseBotCheckin):
     async def retry(self):
         self._retries += 1
         if self._retries <= self.retries:
-            await asyncio.sleep(5)
             await self.send_checkin()
         else:
             self.log.warning("超过最大重试次数.")
@@ -250,9 +319,10 @@ class AnswerBotCheckin(BotCheckin):
         async for m in self.client.get_chat_history(
             self.chat_name or self.bot_id or self.bot_username, limit=limit
         ):
-            if MessageType.ANSWER in self.message_type(m):
+            type = self.message_type(m)
+            if MessageType.ANSWER in type:
                 answer = answer or m
-            if MessageType.CAPTCHA in self.message_type(m):
+            if MessageType.CAPTCHA in type:
                 captcha = captcha or m
             if answer and captcha:
                 break
@@ -269,20 +339,24 @@ class AnswerBotCheckin(BotCheckin):
         elif isinstance(reply_markup, ReplyKeyboardMarkup):
             return [k.text for r in reply_markup.keyboard for k in r]
 
+    @classmethod
+    def compile(cls):
+        super().compile()
+        cls._button_re = re.compile(cls.bot_checkin_button_pat) if cls.bot_checkin_button_pat else None
+
     def is_valid_answer(self, message: Message):
         if not message.reply_markup:
             return False
-        if self.bot_checkin_button_pat:
-            for k in self.get_keys(message):
-                if not re.search(self.bot_checkin_button_pat, k):
-                    return False
+        if self._button_re:
+            return all(self._button_re.search(k) for k in self.get_keys(message) or ())
         return True
 
     def message_type(self, message: Message):
+        type = super().message_type(message)
         if self.is_valid_answer(message):
-            return MessageType.ANSWER | super().message_type(message)
+            return MessageType.ANSWER | type if type else MessageType.ANSWER
         else:
-            return super().message_type(message)
+            return type
 
     async def message_handler(self, client: Client, message: Message):
         type = self.message_type(message)
@@ -290,6 +364,10 @@ class AnswerBotCheckin(BotCheckin):
             await self.on_answer(message)
         await super().message_handler(client, message, type=type)
 
+    async def retry(self):
+        self.message = None
+        await super().retry()
+
     async def on_answer(self, message: Message):
         async with self.mutex:
             if self.message:
@@ -305,10 +383,12 @@ class AnswerBotCheckin(BotCheckin):
         async with self.operable:
             if not self.message:
                 await self.operable.wait()
-            match = [(k, fuzz.ratio(k, captcha)) for k in self.get_keys(self.message)]
-            max_k, max_r = max(match, key=lambda x: x[1])
+            keys = self.get_keys(self.message)
+            match = [(c, k, fuzz.ratio(k, c)) for c in self.captcha_candidates(captcha) for k in keys]
+            max_c, max_k, max_r = max(match, key=lambda x: x[2])
             if max_r < 75:
                 self.log.info(f'未能找到对应 "{captcha}" 的按键, 正在重试.')
                 await self.retry()
             else:
+                self.use_captcha(max_c)
                 await self.message.click(max_k)
@@ -12,6 +12,10 @@ class JMSCheckin(AnswerBotCheckin):
         async with self.operable:
             if not self.message:
                 await self.operable.wait()
+            keys = self.get_keys(self.message)
+            candidates = self.captcha_candidates(captcha)
+            captcha = next((c for c in candidates if all(l in keys for l in c)), captcha)
+            self.use_captcha(captcha)
             for l in captcha:
                 try:
                     await self.message.click(l)
@@ -1,5 +1,3 @@
-from pyrogram.types import Message
-
 from .base import AnswerBotCheckin
 
 
@@ -8,5 +6,6 @@ class JMSIPTVCheckin(AnswerBotCheckin):
     bot_username = "JMSIPTV_bot"
     bot_captcha_len = 5
 
-    async def on_captcha(self, message: Message, captcha: str):
-        await super().on_captcha(message, captcha.upper())
+    @classmethod
+    def clean_captcha(cls, text: str):
+        return super().clean_captcha(text).upper()
@@ -1,99 +1,160 @@
 import asyncio
 import contextlib
-from urllib.parse import urlparse
+import time
+from urllib.parse import parse_qs, urlparse
 
-from aiohttp import ClientSession
-from aiohttp_socks import ProxyConnector, ProxyType
 from pyrogram.raw.functions.messages import RequestWebView
 from pyrogram.raw.functions.users import GetFullUser
 
 from ...utils import remove_prefix
 from .base import BaseBotCheckin
-from ..captcha.yescaptcha import YesCaptcha
+from ..captcha import get_solver
+from ..captcha.pool import tokens
+from ..http import get_session
 
 
 class NebulaCheckin(BaseBotCheckin):
     name = "Nebula"
     bot_username = "Nebula_Account_bot"
+    website_key = "0x4AAAAAAADGwT_-TpuCDrw9"
+    website_url = "https://web.nebula-emby.com/"
+    webapp_ttl = 3600
 
     def __init__(self, *args, **kw):
         super().__init__(*args, **kw)
         self._retries = 0
-        proxy = self.client.proxy
-        self.connector = (
-            ProxyConnector(
-                proxy_type=ProxyType[proxy["scheme"].upper()],
-                host=proxy["hostname"],
-                port=proxy["port"],
-            )
-            if proxy
-            else None
+        self._prefetch: asyncio.Task = None
+
+    def solver(self):
+        return get_solver(
+            self.captcha_service,
+            self.captcha_service_key,
+            websiteKey=self.website_key,
+            websiteURL=self.website_url,
+            proxy=self.client.proxy,
+            hedge=self.captcha_hedge,
         )
 
-    async def retry(self):
-        self._retries += 1
-        if self._retries <= self.retries:
-            await asyncio.sleep(5)
-            await self.start()
+    def prefetch(self, wait=0, limit=None):
+        solver = self.solver()
+        if not solver:
+            return
+        lead = 1.5 * (solver.expected or 20)
+        key = (self.website_key, self.website_url)
+
+        async def _prefetch():
+            await asyncio.sleep(max(0, wait - lead))
+            if limit:
+                await tokens.reserve(key, limit)
+            tokens.prefetch(key, solver.solve)
+
+        self._prefetch = asyncio.create_task(_prefetch())
+        return self._prefetch
+
+    async def get_token(self):
+        solver = self.solver()
+        if not solver:
+            return ""
+        try:
+            token = await tokens.get((self.website_key, self.website_url), solver.solve)
+        except Exception as e:
+            self.log.warning(f"接收到异常返回信息: {e}")
         else:
-            self.log.warning("超过最大重试次数.")
-            self.finished.set()
+            if token:
+                self.log.info("验证码获取成功.")
+                return token
+        return ""
 
     async def start(self):
-        try:
-            with contextlib.suppress(asyncio.TimeoutError):
-                await asyncio.wait_for(self._checkin(), self.timeout)
-        except OSError as e:
-            self.log.info(f'发生错误: "{e}", 正在重试.')
-            await self.retry()
+        while True:
+            try:
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._checkin(), self.timeout)
+            except OSError as e:
+                self._retries += 1
+                if self._retries <= self.retries:
+                    self.log.info(f'发生错误: "{e}", 正在重试.')
+                    await asyncio.sleep(5)
+                    continue
+                self.log.warning("超过最大重试次数.")
+                self.finished.set()
+            break
         if not self.finished.is_set():
             self.log.warning("无法在时限内完成签到.")
             return False
         else:
             return self._retries <= self.retries
 
-    async def _checkin(self):
-        bot = await self.client.get_users(self.bot_username)
-        self.log.info(f"开始执行签到: [green]{bot.first_name}[/] [gray50](@{bot.username})[/].")
+    async def get_webapp_url(self, refresh=False):
+        """获取带签名的网页应用地址, 菜单地址与签名数据在有效期内均使用缓存, refresh 时重新签名."""
+        cache = self.client.cache
+        cached = None if refresh else cache.get("webapp", self.bot_username)
+        if cached:
+            return cached["url"]
         bot_peer = await self.client.resolve_peer(self.bot_username)
-        user_full = await self.client.invoke(GetFullUser(id=bot_peer))
-        url = user_full.full_user.bot_info.menu_button.url
+        menu = cache.get("menu", self.bot_username)
+        if menu:
+            url = menu["url"]
+        else:
+            user_full = await self.client.invoke(GetFullUser(id=bot_peer))
+            url = user_full.full_user.bot_info.menu_button.url
+            cache.set("menu", (self.bot_username,), {"url": url})
         url_auth = (
             await self.client.invoke(RequestWebView(peer=bot_peer, bot=bot_peer, platform="ios", url=url))
         ).url
+        data = parse_qs(urlparse(url_auth).fragment).get("tgWebAppData", [""])[0]
+        auth_date = parse_qs(data).get("auth_date", [None])[0]
+        if auth_date and auth_date.isdigit():
+            ttl = int(auth_date) + self.webapp_ttl - time.time()
+            if ttl > 60:
+                cache.set("webapp", (self.bot_username,), {"url": url_auth}, ttl=ttl - 60)
+        return url_auth
+
+    async def _checkin(self):
+        if self._prefetch:
+            self._prefetch.cancel()
+        token = asyncio.create_task(self.get_token())
+        try:
+            return await self._checkin_with(token)
+        finally:
+            token.cancel()
+
+    async def _submit(self, url_auth: str, token: str):
         scheme = urlparse(url_auth)
-        token = ''
-        websiteKey = "0x4AAAAAAADGwT_-TpuCDrw9"
-        websiteURL = "https://web.nebula-emby.com/"
-        if self.captcha_service == 'yescaptcha':
-            task_type = "TurnstileTaskProxylessM1"
-            clientKey = self.captcha_service_key
-            yc = YesCaptcha(clientKey=clientKey, websiteKey=websiteKey, websiteURL=websiteURL, task_type=task_type)
-            try:
-                token = await yc.solve()
-            except Exception as e:
-                self.log.warning(f"接收到异常返回信息: {e}")
-            else:
-                self.log.info("验证码获取成功.")
         data = remove_prefix(scheme.fragment, "tgWebAppData=")
         user_checkin_url = scheme._replace(path="/api/proxy/userCheckIn", query=f"data={data}&token={token}").geturl()
-        async with ClientSession(connector=self.connector) as session:
-            async with session.get(user_checkin_url) as resp:
-                check_results = await resp.json()
-            message = check_results["message"]
-            if "失败" in message:
-                self.log.info("签到失败, 正在重试.")
-                self.finished.set()
-#                 await self.retry()
-            if "重复" in message:
-                self.log.info("今日已经签到过了.")
-                self.finished.set()
-            elif "成功" in message:
-                self.log.info(
-                    f"[yellow]签到成功[/]: + {check_results['get_credit']} 分 -> {check_results['credit']} 分."
-                )
-                self.finished.set()
-            else:
-                if "验证失败" in message:
-                    message = message + '，建议前往设置验证码识别 ( https://github.com/embykeeper/embykeeper/blob/main/README.md#%E9%85%8D%E7%BD%AE%E9%A1%B9 )'
-                self.log.warning(f"接收到异常返回信息: {message}")
+        async with get_session(self.client.proxy).get(user_checkin_url) as resp:
+            return await resp.json()
+
+    async def _checkin_with(self, token: asyncio.Task):
+        bot = await self.client.cache.get_user(self.bot_username)
+        self.log.info(f"开始执行签到: [green]{bot.first_name}[/] [gray50](@{bot.username})[/].")
+        cached = self.client.cache.get("webapp", self.bot_username) is not None
+        url_auth = await self.get_webapp_url()
+        check_results = await self._submit(url_auth, await token)
+        message = check_results["message"]
+        if not any(s in message for s in ("重复", "成功")):
+            self.client.cache.drop("webapp", self.bot_username)
+            if cached:
+                self.log.debug("缓存的网页应用签名未被接受, 正在重新获取并重试.")
+                url_auth = await self.get_webapp_url(refresh=True)
+                check_results = await self._submit(url_auth, await self.get_token())
+                message = check_results["message"]
+                if not any(s in message for s in ("重复", "成功")):
+                    self.client.cache.drop("webapp", self.bot_username)
+        if "失败" in message:
+            self.log.info("签到失败, 正在重试.")
+            self.finished.set()
+        if "重复" in message:
+            self.log.info("今日已经签到过了.")
+            self.finished.set()
+        elif "成功" in message:
+            self.points = check_results.get("credit", None)
+            self.log.info(
+                f"[yellow]签到成功[/]: + {check_results['get_credit']} 分 -> {check_results['credit']} 分."
+            )
+            self.finished.set()
+        else:
+            if "验证失败" in message:
+                message = message + '，建议前往设置验证码识别 ( https://github.com/embykeeper/embykeeper/blob/main/README.md#%E9%85%8D%E7%BD%AE%E9%A1%B9 )'
+            self.log.warning(f"接收到异常返回信息: {message}")
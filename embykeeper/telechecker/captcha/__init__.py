@@ -0,0 +1,30 @@
+from loguru import logger
+
+from ...utils import to_iterable
+from .hedge import HedgedSolver
+from .yescaptcha import CapSolver, YesCaptcha
+
+SOLVERS = {s.name: s for s in (YesCaptcha, CapSolver)}
+
+
+def register(cls):
+    SOLVERS[cls.name] = cls
+    return cls
+
+
+def get_solver(service, key, websiteKey, websiteURL, proxy=None, hedge=None):
+    """根据配置构建验证码求解器, 配置多个服务 (可重复) 时返回对冲求解器."""
+    solvers = []
+    for s in to_iterable(service):
+        if not s or s == "disabled":
+            continue
+        cls = SOLVERS.get(s, None)
+        if not cls:
+            logger.bind(scheme="telechecker").warning(f'未知的验证码服务: "{s}".')
+            continue
+        k = key.get(s, None) if isinstance(key, dict) else key
+        solvers.append(cls(k, websiteKey, websiteURL, proxy=proxy))
+    if len(solvers) > 1:
+        return HedgedSolver(solvers, delay=hedge)
+    elif solvers:
+        return solvers[0]
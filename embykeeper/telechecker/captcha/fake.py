@@ -0,0 +1,91 @@
+import asyncio
+import time
+import uuid
+
+from aiohttp import web
+
+"""
+本地模拟 YesCaptcha 接口, 用于离线测试识别延迟:
+
+    async with FakeYesCaptcha(delay=5) as server:
+        yc = YesCaptcha(clientKey, websiteKey, websiteURL, task_type, api=server.url)
+        token = await yc.solve()
+"""
+
+
+class FakeYesCaptcha:
+    def __init__(self, delay=5, error=False, host="127.0.0.1", port=0):
+        self.delay = delay
+        self.error = error
+        self.host = host
+        self.port = port
+        self.tasks = {}
+        self.polls = 0
+        self.runner = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    async def create_task(self, request: web.Request):
+        data = await request.json()
+        if not data.get("clientKey"):
+            return web.json_response({"errorId": 1, "errorDescription": "clientKey 为空"})
+        taskId = str(uuid.uuid4())
+        self.tasks[taskId] = time.monotonic() + self.delay
+        return web.json_response({"errorId": 0, "taskId": taskId})
+
+    async def get_task_result(self, request: web.Request):
+        data = await request.json()
+        self.polls += 1
+        ready = self.tasks.get(data.get("taskId"), None)
+        if ready is None or self.error:
+            return web.json_response({"errorId": 1, "errorDescription": "任务不存在"})
+        if time.monotonic() < ready:
+            return web.json_response({"errorId": 0, "status": "processing"})
+        return web.json_response({"errorId": 0, "status": "ready", "solution": {"token": f"fake-{data['taskId']}"}})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/createTask", self.create_task)
+        app.router.add_post("/getTaskResult", self.get_task_result)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        self.port = self.runner.addresses[0][1]
+        return self
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *_):
+        await self.stop()
+
+
+if __name__ == "__main__":
+    from rich.console import Console
+
+    from ..http import close_sessions
+    from .yescaptcha import YesCaptcha
+
+    async def main(delay=5):
+        console = Console()
+        async with FakeYesCaptcha(delay=delay) as server:
+            yc = YesCaptcha("fake", "fake", "https://example.com/", "TurnstileTaskProxylessM1", api=server.url)
+            for i in range(3):
+                polls = server.polls
+                start = time.perf_counter()
+                token = await yc.solve()
+                spent = time.perf_counter() - start
+                console.print(
+                    f"#{i + 1} token={token} 耗时={spent:.2f}s 轮询={server.polls - polls}次 (模拟解题 {delay}s)"
+                )
+            await close_sessions()
+
+    asyncio.run(main())
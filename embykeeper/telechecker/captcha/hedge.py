@@ -0,0 +1,86 @@
+import asyncio
+import time
+from collections import deque
+
+from loguru import logger
+
+from ...utils import percentile
+
+"""
+对冲求解: 依次启动多个验证码任务, 任一返回有效令牌即取消其余任务.
+"""
+
+
+class HedgedSolver:
+    latencies = {}
+    default_delay = 15
+
+    def __init__(self, solvers, delay=None):
+        self.solvers = list(solvers)
+        self.delay = delay
+        self.log = logger.bind(scheme="telechecker", name="HedgedSolver", username="Nebula")
+
+    @property
+    def expected(self):
+        return min((s.expected for s in self.solvers if s.expected), default=None)
+
+    @classmethod
+    def record(cls, name, spent):
+        cls.latencies.setdefault(name, deque(maxlen=100)).append(spent)
+
+    @classmethod
+    def percentile(cls, name, q):
+        return percentile(cls.latencies.get(name, ()), q)
+
+    def delay_for(self, solver):
+        """未指定对冲延迟时, 使用该服务近期耗时的 P90."""
+        if self.delay is not None:
+            return self.delay
+        if len(self.latencies.get(solver.name, ())) >= 5:
+            return self.percentile(solver.name, 0.9)
+        return self.default_delay
+
+    async def _run(self, solver):
+        start = time.monotonic()
+        token = await solver.solve()
+        if token:
+            spent = time.monotonic() - start
+            self.record(solver.name, spent)
+            self.log.debug(
+                f"{solver.name} 耗时 {spent:.1f} 秒 (P50 {self.percentile(solver.name, 0.5):.1f} 秒, "
+                f"P90 {self.percentile(solver.name, 0.9):.1f} 秒)."
+            )
+        return token
+
+    async def solve(self):
+        queue = list(self.solvers)
+        pending = {}
+
+        def launch():
+            solver = queue.pop(0)
+            pending[asyncio.create_task(self._run(solver))] = solver
+            return solver
+
+        try:
+            current = launch()
+            while pending:
+                timeout = self.delay_for(current) if queue else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self.log.info(f"{current.name} 超过 {timeout:.0f} 秒未完成, 启动对冲任务.")
+                    current = launch()
+                    continue
+                for t in done:
+                    solver = pending.pop(t)
+                    try:
+                        token = t.result()
+                    except Exception as e:
+                        self.log.warning(f"{solver.name} 识别错误: {e}")
+                        token = None
+                    if token:
+                        return token
+                if queue:
+                    current = launch()
+        finally:
+            for t in pending:
+                t.cancel()
@@ -0,0 +1,98 @@
+import asyncio
+import contextlib
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from math import inf
+from typing import Awaitable, Callable, Hashable
+
+"""
+验证码令牌预取池: 提前解出令牌并按有效期保存, 签到时可直接取用.
+"""
+
+
+@dataclass
+class TokenEntry:
+    task: asyncio.Future
+    expires: float = field(default=inf)
+
+    def valid(self):
+        if not self.task.done():
+            return True
+        if self.task.cancelled() or self.task.exception() or not self.task.result():
+            return False
+        return self.expires > time.monotonic()
+
+
+class TokenPool:
+    def __init__(self, ttl=270):
+        self.ttl = ttl
+        self.entries = {}
+        self.changed = asyncio.Condition()
+
+    def prefetch(self, key: Hashable, solve: Callable[[], Awaitable[str]]):
+        """开始预取一个令牌, 令牌解出后 ttl 秒内有效."""
+        entry = TokenEntry(asyncio.ensure_future(solve()))
+
+        def expire(_):
+            entry.expires = time.monotonic() + self.ttl
+            if not entry.valid():
+                asyncio.ensure_future(self._notify())
+
+        entry.task.add_done_callback(expire)
+        self.entries.setdefault(key, deque()).append(entry)
+        return entry.task
+
+    def _pop(self, key):
+        entries = self.entries.get(key, None)
+        if not entries:
+            return None
+        valid = [e for e in entries if e.valid()]
+        entries.clear()
+        entries.extend(valid)
+        for e in valid:
+            if e.task.done():
+                entries.remove(e)
+                return e
+        return entries.popleft() if entries else None
+
+    async def get(self, key: Hashable, solve: Callable[[], Awaitable[str]]):
+        """取用一个令牌, 优先使用已解出的令牌, 其次等待正在预取的令牌, 否则立即求解."""
+        while True:
+            entry = self._pop(key)
+            if not entry:
+                return await solve()
+            await self._notify()
+            try:
+                token = await asyncio.shield(entry.task)
+            except asyncio.CancelledError:
+                if not entry.task.done():
+                    self.entries[key].appendleft(entry)
+                raise
+            except Exception:
+                continue
+            if token and entry.expires > time.monotonic():
+                return token
+
+    async def reserve(self, key: Hashable, limit: int):
+        """等待该键未取用的令牌数低于 limit, 以免预取的令牌在取用前过期."""
+        async with self.changed:
+            while self.pending(key) >= limit:
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self.changed.wait(), 10)
+
+    async def _notify(self):
+        async with self.changed:
+            self.changed.notify_all()
+
+    def pending(self, key: Hashable):
+        return sum(1 for e in self.entries.get(key, ()) if e.valid())
+
+    def clear(self):
+        for entries in self.entries.values():
+            for e in entries:
+                e.task.cancel()
+        self.entries.clear()
+
+
+tokens = TokenPool()
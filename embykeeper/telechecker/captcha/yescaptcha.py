@@ -1,21 +1,35 @@
-import time
-import requests
 import asyncio
+import time
+
+from aiohttp import ClientError
 from loguru import logger
 
-""" 
-YESCAPTCHA验证码Requests版本
+from ..http import get_session
+
+"""
+YESCAPTCHA验证码 aiohttp 版本
 """
 
 
 class YesCaptcha:
+    name = "yescaptcha"
+    api = "https://api.yescaptcha.com"
+    turnstile_task = "TurnstileTaskProxylessM1"
+    expected = None
 
-    def __init__(self, clientKey, websiteKey, websiteURL, task_type):
+    def __init__(self, clientKey, websiteKey, websiteURL, task_type=None, proxy=None, api=None, timeout=360):
         self.clientKey = clientKey
         self.websiteKey = websiteKey
         self.websiteURL = websiteURL
-        self.task_type = task_type
-        self.log = logger.bind(scheme="telechecker", name="YesCaptcha",username="Nebula")
+        self.task_type = task_type or self.turnstile_task
+        self.proxy = proxy
+        self.api = api or self.api
+        self.timeout = timeout
+        self.log = logger.bind(scheme="telechecker", name=type(self).__name__, username="Nebula")
+
+    async def post(self, path, data):
+        async with get_session(self.proxy).post(f"{self.api}/{path}", json=data) as resp:
+            return await resp.json(content_type=None)
 
     async def create_task(self) -> str:
         """
@@ -23,66 +37,69 @@ class YesCaptcha:
         :param
         :return taskId : string 创建成功的任务ID
         """
-        url = "https://api.yescaptcha.com/createTask"
         data = {
             "clientKey": self.clientKey,
-            "task": {
-                "websiteURL": self.websiteURL,
-                "websiteKey": self.websiteKey,
-                "type": self.task_type
-            },
+            "task": {"websiteURL": self.websiteURL, "websiteKey": self.websiteKey, "type": self.task_type},
             "softID": 18097,
         }
         try:
-            result = requests.post(url, json=data).json()
-            # print(result)
-            taskId = result.get('taskId')
+            result = await self.post("createTask", data)
+            taskId = result.get("taskId")
             if taskId:
                 return taskId
-        except Exception as e:
-            self.log.warning(e)
+            self.log.warning(f'创建任务失败: {result.get("errorDescription", result)}')
+        except (ClientError, asyncio.TimeoutError, ValueError) as e:
+            self.log.warning(f"创建任务失败: {e}")
 
-    async def get_response(self, taskID):
+    async def get_response(self, taskID, delay=1.0, backoff=1.5, max_delay=3.0):
         """
         第二步：使用taskId获取response
         :param taskID: string
         :return response: string 识别结果
         """
 
-        # 循环请求识别结果，3秒请求一次
-        times = 0
-        while times < 120:
+        # 首次等待至历史平均耗时附近, 之后间隔从 delay 秒起逐步增加至 max_delay 秒
+        data = {"clientKey": self.clientKey, "taskId": taskID}
+        start = time.monotonic()
+        deadline = start + self.timeout
+        first = max(delay, 0.8 * self.expected) if self.expected else delay
+        await asyncio.sleep(first - delay)
+        while time.monotonic() < deadline:
+            await asyncio.sleep(delay)
+            delay = min(delay * backoff, max_delay)
             try:
-                url = "https://api.yescaptcha.com/getTaskResult"
-                data = {
-                    "clientKey": self.clientKey,
-                    "taskId": taskID
-                }
-                result = requests.post(url, json=data).json()
-                # print(result)
-                if result.get('errorId') == 1:
-                    throw = result.get('errorDescription')
-                    self.log.warning('识别错误:' + throw)
-                    return
-                if result.get('status') == 'processing':
-                    times += 1
-                    time.sleep(3)
-                    continue
-                response = result.get('solution').get('token')
-                return response
-                self.log.warning('返回异常:' + result)
-            except Exception as e:
-                self.log.warning(e)
+                result = await self.post("getTaskResult", data)
+            except (ClientError, asyncio.TimeoutError, ValueError) as e:
+                self.log.warning(f"获取结果失败: {e}")
+                continue
+            if result.get("errorId") == 1:
+                self.log.warning(f'识别错误: {result.get("errorDescription")}')
+                return
+            if result.get("status") == "processing":
+                continue
+            token = (result.get("solution") or {}).get("token")
+            if token:
+                spent = time.monotonic() - start
+                cls = type(self)
+                cls.expected = spent if cls.expected is None else 0.7 * cls.expected + 0.3 * spent
+            else:
+                self.log.warning(f"返回异常: {result}")
+            return token
+        self.log.warning("识别超时.")
 
     async def solve(self):
         taskId = await self.create_task()
-        self.log.info('创建任务:' + taskId)
         if taskId is not None:
+            self.log.info(f"创建任务: {taskId}")
             response = await self.get_response(taskId)
-            self.log.info('识别结果:' + response)
+            if response:
+                self.log.info(f"识别结果: {response}")
             return response
 
 
-# if __name__ == '__main__':
-#     yc = YesCaptcha(clientKey, websiteKey, websiteURL, task_type)
-#     asyncio.run(yc.solve())
+class CapSolver(YesCaptcha):
+    """CapSolver 与 YesCaptcha 使用相同的任务接口."""
+
+    name = "capsolver"
+    api = "https://api.capsolver.com"
+    turnstile_task = "AntiTurnstileTaskProxyLess"
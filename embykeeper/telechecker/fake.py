@@ -0,0 +1,361 @@
+import asyncio
+import base64
+import io
+import itertools
+import json
+import re
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+from typing import List, Union
+
+from pyrogram import types
+from pyrogram.enums import ChatMemberStatus, ChatType
+from pyrogram.handlers import EditedMessageHandler, MessageHandler
+
+from ..utils import percentile
+from .bots.base import AnswerBotCheckin, BotCheckin
+from .tele import Client, ClientsSession
+
+"""
+离线模拟 Telegram 客户端与机器人对话, 用于在无真实账号时测试签到器并进行压力测试:
+
+    python -m embykeeper.telechecker.fake --accounts 100
+"""
+
+
+@dataclass
+class Reply:
+    text: str = None
+    photo: bytes = None
+    caption: str = None
+    keyboard: List[str] = None
+
+    @classmethod
+    def from_dict(cls, data: dict, base: Path = Path(".")):
+        photo = data.get("photo", None)
+        if photo:
+            path = base / photo
+            photo = path.read_bytes() if path.is_file() else base64.b64decode(photo)
+        return cls(text=data.get("text"), photo=photo, caption=data.get("caption"), keyboard=data.get("keyboard"))
+
+
+@dataclass
+class Turn:
+    user: str
+    bot: List[Reply]
+
+
+@dataclass
+class Transcript:
+    """机器人对话脚本: 用户输入依次匹配各轮次, 不匹配时回复 fallback 并回到第一轮."""
+
+    turns: List[Turn]
+    fallback: List[Reply] = field(default_factory=list)
+    username: str = "fake_bot"
+    first_name: str = "FakeBot"
+    id: int = 1000000
+
+    @classmethod
+    def from_file(cls, path: Union[str, Path]):
+        path = Path(path)
+        data = json.loads(path.read_text(encoding="utf-8"))
+        turns = [Turn(t["user"], [Reply.from_dict(r, path.parent) for r in t["bot"]]) for t in data["turns"]]
+        fallback = [Reply.from_dict(r, path.parent) for r in data.get("fallback", [])]
+        extra = {k: data[k] for k in ("username", "first_name", "id") if k in data}
+        return cls(turns, fallback, **extra)
+
+    @staticmethod
+    def image(code: str):
+        from PIL import Image, ImageDraw, ImageFont
+
+        try:
+            font = ImageFont.load_default(size=28)
+        except TypeError:
+            font = ImageFont.load_default()
+        image = Image.new("RGB", (120, 40), "white")
+        ImageDraw.Draw(image).text((8, 4), code, fill="black", font=font)
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG")
+        return buffer.getvalue()
+
+    @classmethod
+    def captcha(cls, code="1234"):
+        """默认脚本: 发送验证码图片, 回复正确则签到成功."""
+        return cls(
+            turns=[
+                Turn("/checkin", [Reply(photo=cls.image(code), caption="请输入验证码")]),
+                Turn(re.escape(code), [Reply(text="签到成功, + 5 分 -> 105 分")]),
+            ],
+            fallback=[Reply(text="验证码错误, 签到失败")],
+        )
+
+    @classmethod
+    def keyboard(cls, code="1234"):
+        """按键脚本: 发送验证码图片与候选按键, 点击正确的按键则签到成功."""
+        keys = sorted({code, code[::-1], code[1:] + code[:1], code[-1:] + code[:-1]})
+        return cls(
+            turns=[
+                Turn("/checkin", [Reply(photo=cls.image(code), caption="请选择验证码", keyboard=keys)]),
+                Turn(re.escape(code), [Reply(text="签到成功, + 5 分 -> 105 分")]),
+            ],
+            fallback=[Reply(text="验证码错误, 签到失败")],
+        )
+
+    def conversation(self):
+        return Conversation(self)
+
+
+class Conversation:
+    def __init__(self, transcript: Transcript):
+        self.transcript = transcript
+        self.index = 0
+
+    def respond(self, text: str):
+        turns = self.transcript.turns
+        if self.index < len(turns) and re.fullmatch(turns[self.index].user, text or ""):
+            turn = turns[self.index]
+        elif re.fullmatch(turns[0].user, text or ""):
+            self.index, turn = 0, turns[0]
+        else:
+            self.index = 0
+            return self.transcript.fallback
+        self.index = (self.index + 1) % len(turns)
+        return turn.bot
+
+
+class FakeClient(Client):
+    """实现签到器, 监视器所用接口的离线客户端, 机器人回复由对话脚本生成."""
+
+    ids = itertools.count(1)
+
+    def __init__(self, phone: str, transcripts: List[Transcript], latency=0.0):
+        self.name = self.phone_number = phone
+        self.proxy = None
+        self.in_memory = True
+        self.workdir = Path(".")
+        self.latency = latency
+        self.me = types.User(id=next(self.ids), is_self=True, first_name=f"Fake {phone}", client=self)
+        self.handlers = {}
+        self.bots = {}
+        for t in transcripts:
+            self.bots[t.username.lower()] = self.bots[t.id] = (t, t.conversation())
+        self.latencies = []
+        self.message_ids = itertools.count(1)
+        self.pending = set()
+        self.history = {}
+
+    def bot(self, ident):
+        key = ident.lower().lstrip("@") if isinstance(ident, str) else ident
+        return self.bots[key]
+
+    def bot_user(self, transcript: Transcript):
+        return types.User(
+            id=transcript.id,
+            is_bot=True,
+            first_name=transcript.first_name,
+            username=transcript.username,
+            client=self,
+        )
+
+    def bot_chat(self, transcript: Transcript):
+        return types.Chat(
+            id=transcript.id,
+            type=ChatType.BOT,
+            first_name=transcript.first_name,
+            username=transcript.username,
+            client=self,
+        )
+
+    def add_handler(self, handler, group: int = 0):
+        self.handlers.setdefault(group, []).append(handler)
+
+    def remove_handler(self, handler, group: int = 0):
+        self.handlers.get(group, []).remove(handler)
+
+    async def dispatch(self, message: types.Message, edited=False):
+        kind = EditedMessageHandler if edited else MessageHandler
+        for group in sorted(self.handlers):
+            for handler in list(self.handlers[group]):
+                if type(handler) is kind and await handler.check(self, message):
+                    start = time.perf_counter()
+                    await handler.callback(self, message)
+                    self.latencies.append(time.perf_counter() - start)
+                    break
+
+    def inject(self, message: types.Message, edited=False):
+        """模拟收到一条消息, 在后台分发给已注册的处理器."""
+
+        async def _dispatch():
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            await self.dispatch(message, edited)
+
+        task = asyncio.create_task(_dispatch())
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+        return task
+
+    def make_message(self, transcript: Transcript, reply: Reply):
+        keyboard = None
+        if reply.keyboard:
+            keyboard = types.InlineKeyboardMarkup(
+                [[types.InlineKeyboardButton(k, callback_data=k)] for k in reply.keyboard]
+            )
+        return types.Message(
+            id=next(self.message_ids),
+            chat=self.bot_chat(transcript),
+            from_user=self.bot_user(transcript),
+            date=datetime.now(),
+            text=reply.text,
+            caption=reply.caption,
+            photo=SimpleNamespace(data=reply.photo) if reply.photo else None,
+            reply_markup=keyboard,
+            outgoing=False,
+            client=self,
+        )
+
+    def converse(self, ident, text):
+        transcript, conversation = self.bot(ident)
+        for reply in conversation.respond(text):
+            message = self.make_message(transcript, reply)
+            self.history.setdefault(transcript.id, []).append(message)
+            self.inject(message)
+
+    async def get_users(self, ident):
+        return self.bot_user(self.bot(ident)[0])
+
+    async def get_chat(self, ident):
+        return self.bot_chat(self.bot(ident)[0])
+
+    async def get_chat_member(self, chat_id, user_id):
+        return SimpleNamespace(status=ChatMemberStatus.MEMBER)
+
+    async def get_archived(self):
+        return set()
+
+    async def get_chat_history(self, chat_id, limit=0, **kw):
+        messages = self.history.get(self.bot(chat_id)[0].id, [])[::-1]
+        for m in messages[:limit] if limit else messages:
+            yield m
+
+    async def send_message(self, chat_id, text, **kw):
+        self.converse(chat_id, text)
+        return types.Message(id=next(self.message_ids), text=text, outgoing=True, client=self)
+
+    async def request_callback_answer(self, chat_id, message_id, callback_data, **kw):
+        if isinstance(callback_data, bytes):
+            callback_data = callback_data.decode()
+        self.converse(chat_id, callback_data)
+        return SimpleNamespace(message=None)
+
+    async def download_media(self, message, in_memory=False, **kw):
+        return io.BytesIO(message.photo.data)
+
+    async def archive_chats(self, chat_ids):
+        return True
+
+    async def stop(self, block=True):
+        for task in list(self.pending):
+            task.cancel()
+
+
+class FakeClientsSession(ClientsSession):
+    transcripts = []
+    latency = 0.0
+
+    @classmethod
+    async def login(cls, account, proxy):
+        return FakeClient(account["phone"], cls.transcripts, latency=cls.latency)
+
+
+class FakeCheckin(BotCheckin):
+    name = "模拟机器人"
+    bot_username = "fake_bot"
+    bot_captcha_len = range(1, 10)
+
+
+class FakeAnswerCheckin(AnswerBotCheckin):
+    name = "模拟按键机器人"
+    bot_username = "fake_bot"
+    bot_captcha_len = range(1, 10)
+
+
+async def loadtest(accounts=10, transcript: Transcript = None, cls=FakeCheckin, latency=0.0, timeout=120):
+    """使用模拟账号并发执行签到, 返回统计结果."""
+    transcript = transcript or Transcript.captcha()
+    cls = type(cls.__name__, (cls,), {"bot_username": transcript.username})
+    FakeClientsSession.transcripts = [transcript]
+    FakeClientsSession.latency = latency
+    phones = [f"+0000{i:06d}" for i in range(accounts)]
+    durations = []
+    clients = []
+
+    async def run(tg):
+        start = time.perf_counter()
+        result = await cls(tg, retries=3, timeout=timeout)._start()
+        durations.append(time.perf_counter() - start)
+        return result
+
+    start = time.perf_counter()
+    async with FakeClientsSession([{"phone": p} for p in phones]) as session:
+        tasks = []
+        async for tg in session:
+            clients.append(tg)
+            tasks.append(asyncio.create_task(run(tg)))
+        results = await asyncio.gather(*tasks)
+    spent = time.perf_counter() - start
+    latencies = [l for c in clients for l in c.latencies]
+    return {
+        "accounts": accounts,
+        "succeeded": sum(1 for r in results if r),
+        "spent": spent,
+        "rate": accounts / spent,
+        "checkin_p50": percentile(durations, 0.5),
+        "checkin_p99": percentile(durations, 0.99),
+        "handler_p50": percentile(latencies, 0.5),
+        "handler_p99": percentile(latencies, 0.99),
+    }
+
+
+if __name__ == "__main__":
+    import typer
+    from rich.console import Console
+    from rich.table import Table
+
+    from .ocr import ocr
+
+    def main(
+        accounts: List[int] = typer.Option([1, 10, 100], "--accounts", "-n", help="模拟账号数 (可多次指定)"),
+        transcript: Path = typer.Option(None, "--transcript", "-t", exists=True, dir_okay=False, help="对话脚本"),
+        latency: float = typer.Option(0.0, "--latency", "-l", help="模拟机器人回复延迟 (秒)"),
+        keyboard: bool = typer.Option(False, "--keyboard", "-k", help="使用按键签到器与按键脚本"),
+    ):
+        if transcript:
+            script = Transcript.from_file(transcript)
+        else:
+            script = Transcript.keyboard() if keyboard else Transcript.captcha()
+        cls = FakeAnswerCheckin if keyboard else FakeCheckin
+        table = Table("账号数", "成功", "耗时 (s)", "签到/秒", "签到 P50/P99 (ms)", "处理 P50/P99 (ms)")
+
+        async def run():
+            try:
+                for n in accounts:
+                    r = await loadtest(n, script, cls=cls, latency=latency)
+                    table.add_row(
+                        str(n),
+                        str(r["succeeded"]),
+                        f"{r['spent']:.2f}",
+                        f"{r['rate']:.1f}",
+                        f"{r['checkin_p50'] * 1000:.1f} / {r['checkin_p99'] * 1000:.1f}",
+                        f"{r['handler_p50'] * 1000:.1f} / {r['handler_p99'] * 1000:.1f}",
+                    )
+            finally:
+                ocr.shutdown()
+
+        asyncio.run(run())
+        Console().print(table)
+
+    typer.run(main)
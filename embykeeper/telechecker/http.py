@@ -0,0 +1,32 @@
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+from aiohttp_socks import ProxyConnector, ProxyType
+
+"""
+按代理共享的 HTTP 会话池, 复用连接以避免重复的 TLS 握手.
+"""
+
+sessions = {}
+
+
+def get_session(proxy=None) -> ClientSession:
+    key = (proxy["scheme"], proxy["hostname"], proxy["port"]) if proxy else None
+    session = sessions.get(key, None)
+    if not session or session.closed:
+        if proxy:
+            connector = ProxyConnector(
+                proxy_type=ProxyType[proxy["scheme"].upper()],
+                host=proxy["hostname"],
+                port=proxy["port"],
+            )
+        else:
+            connector = TCPConnector()
+        session = ClientSession(connector=connector, timeout=ClientTimeout(total=30))
+        sessions[key] = session
+    return session
+
+
+async def close_sessions():
+    closing = list(sessions.values())
+    sessions.clear()
+    for session in closing:
+        await session.close()
@@ -0,0 +1,64 @@
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Iterable
+
+from pyrogram import Client
+from tinydb import Query, TinyDB
+from tinydb.table import Document
+
+
+class Ledger:
+    """签到记录: 按账号保存在会话文件旁, 记录每个 (签到器, 日期) 的结果与积分, 用于跳过当日已完成的签到."""
+
+    keep = 30
+
+    def __init__(self, workdir=Client.WORKDIR):
+        self.workdir = Path(workdir)
+        self.dbs = {}
+        self.entries = {}
+
+    def db(self, account: str) -> TinyDB:
+        db = self.dbs.get(account, None)
+        if db is None:
+            db = self.dbs[account] = TinyDB(self.workdir / f"{account}.ledger.json")
+            cutoff = (date.today() - timedelta(days=self.keep)).isoformat()
+            docs = db.all()
+            if any(d["date"] < cutoff for d in docs):
+                db.remove(Query().date < cutoff)
+                docs = db.all()
+            for d in docs:
+                self.entries[account, d["bot"], d["date"]] = d
+        return db
+
+    def get(self, account: str, bot: str, day: date = None):
+        self.db(account)
+        return self.entries.get((account, bot, (day or date.today()).isoformat()), None)
+
+    def done(self, account: str, bot: str, day: date = None):
+        entry = self.get(account, bot, day)
+        return bool(entry and entry["result"])
+
+    def outstanding(self, account: str, bots: Iterable[str], day: date = None):
+        return [b for b in bots if not self.done(account, b, day)]
+
+    def today(self, account: str):
+        day = date.today().isoformat()
+        self.db(account)
+        return [e for (a, _, d), e in self.entries.items() if a == account and d == day]
+
+    def record(self, account: str, bot: str, result: bool, points: int = None, day: date = None):
+        db = self.db(account)
+        day = (day or date.today()).isoformat()
+        entry = {
+            "bot": bot,
+            "date": day,
+            "result": bool(result),
+            "points": points,
+            "time": datetime.now().isoformat(timespec="seconds"),
+        }
+        old = self.entries.get((account, bot, day), None)
+        if old is not None:
+            db.update(entry, doc_ids=[old.doc_id])
+            old.update(entry)
+        else:
+            self.entries[account, bot, day] = Document(entry, doc_id=db.insert(entry))
@@ -1,23 +1,33 @@
 import asyncio
 import inspect
 import operator
-import random
+import re
+import time
 from functools import partial
+from pathlib import Path
 
 from dateutil import parser
 from loguru import logger
 from pyrogram.enums import ChatType
+from pyrogram.errors import RPCError
 from pyrogram.handlers import MessageHandler
 from pyrogram.types import Message
 from rich import box
+from rich.console import Console
 from rich.live import Live
 from rich.panel import Panel
 from rich.progress import MofNCompleteColumn, Progress, SpinnerColumn
 from rich.table import Column, Table
 from rich.text import Text
 
-from ..utils import batch, flatten, time_in_range
+from ..utils import batch, flatten, percentile, time_in_range, to_iterable
 from . import *
+from .bots.base import BotCheckin
+from .captcha.pool import tokens
+from .http import close_sessions
+from .ledger import Ledger
+from .planner import Planner
+from .ocr import OCR, ocr
 from .tele import Client, ClientsSession
 
 logger = logger.bind(scheme="telegram")
@@ -45,6 +55,20 @@ MESSAGERS = [
 ]
 
 
+def peers(clss):
+    idents = []
+    for cls in clss:
+        idents.extend(getattr(cls, a, None) for a in ("chat_name", "bot_id", "bot_username"))
+    return [i for i in idents if i]
+
+
+async def prefetch(tg: Client, idents):
+    try:
+        await tg.cache.prefetch(idents)
+    except RPCError as e:
+        logger.bind(username=tg.me.first_name).warning(f"批量获取会话信息失败: {e}.")
+
+
 def extract(clss):
     extracted = []
     for cls in clss:
@@ -106,17 +130,56 @@ async def dump_message(client: Client, message: Message, table: Table):
     )
 
 
-async def checkin_task(checkiner, sem, wait=0):
-    await asyncio.sleep(wait)
-    async with sem:
-        return await checkiner._start()
+async def warmer(config):
+    ocr.configure(**config.get("ocr", {}))
+    try:
+        await ocr.preload()
+    except Exception as e:
+        logger.opt(exception=e).warning("验证码识别模型预加载失败:")
+
+
+async def checkin_task(checkiner, planner: Planner, wait=0, ledger: Ledger = None):
+    account = checkiner.client.phone_number
+    result = await planner.run(account, type(checkiner).__name__, checkiner._start, wait)
+    if ledger:
+        ledger.record(checkiner.client.phone_number, type(checkiner).__name__, result, checkiner.points)
+    return result
 
 
 async def checkiner(config, instant=False):
-    async with ClientsSession.from_config(config) as clients:
+    ocr.configure(**config.get("ocr", {}))
+    try:
+        await _checkiner(config, instant=instant)
+    finally:
+        ocr.shutdown()
+        tokens.clear()
+        await close_sessions()
+
+
+async def _checkiner(config, instant=False):
+    ledger = Ledger()
+    outstanding = {}
+    for a in config.get("telegram", []):
+        classes = [c for c in extract(CHECKINERS) if not ledger.done(a["phone"], c.__name__)]
+        if classes:
+            outstanding[a["phone"]] = classes
+        else:
+            logger.info(f'账号 "{a["phone"]}" 今日已全部完成签到, 跳过.')
+    accounts = [a for a in config.get("telegram", []) if a["phone"] in outstanding]
+    captcha = any(issubclass(c, BotCheckin) for classes in outstanding.values() for c in classes)
+    if captcha and ocr.warmup and not ocr.executor:
+        asyncio.create_task(warmer(config))
+    planner = Planner(
+        window=0 if instant else 60 * config.get("random", 15),
+        bot_concurrent=int(config.get("bot_concurrent", 2)),
+        account_concurrent=int(config.get("concurrent", 2)),
+    )
+    planner.plan((p, c.__name__) for p, classes in outstanding.items() for c in classes)
+    async with ClientsSession(accounts, proxy=config.get("proxy", None)) as clients:
         coros = []
         async for tg in clients:
-            sem = asyncio.Semaphore(int(config.get("concurrent", 2)))
+            classes = outstanding[tg.phone_number]
+            await prefetch(tg, peers(classes))
             checkiners = [
                 cls(
                     tg,
@@ -125,21 +188,23 @@ async def checkiner(config, instant=False):
                     nofail=config.get("nofail", True),
                     captcha_service=config.get("captcha_service", 'disabled'),
                     captcha_service_key=config.get("captcha_service_key", 'empty'),
+                    captcha_hedge=config.get("captcha_hedge", None),
                 )
-                for cls in extract(CHECKINERS)
+                for cls in classes
             ]
             tasks = []
             for c in checkiners:
-                wait = 0 if instant else random.randint(0, 60 * config.get("random", 15))
-                task = asyncio.create_task(checkin_task(c, sem, wait))
+                wait = planner.wait(tg.phone_number, type(c).__name__)
+                c.prefetch(wait, planner.bot_concurrent)
+                task = asyncio.create_task(checkin_task(c, planner, wait, ledger))
                 tasks.append(task)
 
-            async def _gather_task():
-                return tg, await asyncio.gather(*tasks)
+            async def _gather_task(tg=tg, checkiners=checkiners, tasks=tasks):
+                return tg, checkiners, await asyncio.gather(*tasks)
 
             coros.append(_gather_task())
         for f in asyncio.as_completed(coros):
-            tg, results = await f
+            tg, checkiners, results = await f
             failed = [c for i, c in enumerate(checkiners) if not results[i]]
             if failed:
                 logger.bind(username=tg.me.first_name).error(
@@ -151,22 +216,33 @@ async def monitorer(config):
     jobs = []
     async with ClientsSession.from_config(config, monitor=True) as clients:
         async for tg in clients:
+            await prefetch(tg, peers(extract(MONITORERS)))
             for cls in extract(MONITORERS):
                 jobs.append(asyncio.create_task(cls(tg, nofail=config.get("nofail", True))._start()))
         await asyncio.gather(*jobs)
 
 
+async def holder(accounts, proxy=None):
+    """在连接池中保持账号登录, 供定时任务借用."""
+    async with ClientsSession(accounts, proxy=proxy) as clients:
+        async for _ in clients:
+            pass
+        await asyncio.Event().wait()
+
+
 def messager(config, loop, scheduler):
-    for account in config.get("telegram", []):
-        if account.get("send", False):
-            for cls in extract(MESSAGERS):
-                cls(
-                    account,
-                    loop,
-                    scheduler,
-                    proxy=config.get("proxy", None),
-                    nofail=config.get("nofail", True),
-                ).start()
+    accounts = [a for a in config.get("telegram", []) if a.get("send", False)]
+    for account in accounts:
+        for cls in extract(MESSAGERS):
+            cls(
+                account,
+                loop,
+                scheduler,
+                proxy=config.get("proxy", None),
+                nofail=config.get("nofail", True),
+            ).start()
+    if accounts:
+        loop.create_task(holder(accounts, proxy=config.get("proxy", None)))
 
 
 async def follower(config):
@@ -248,3 +324,80 @@ async def analyzer(config, chats, keywords, timerange, limit=2000):
                         for t, c in sorted(texts.items(), key=operator.itemgetter(1), reverse=True)
                     ]
                 )
+
+
+async def _benchmark(cls, engine: OCR, samples):
+    """逐张识别以统计准确率与单张延迟, 再并发识别全部样本以统计吞吐量."""
+    lens = to_iterable(cls.bot_captcha_len)
+    correct = hits = rejects = 0
+    latencies = []
+
+    async def run(data, label):
+        nonlocal correct, hits, rejects
+        start = time.perf_counter()
+        candidates = await engine.rank(data)
+        latencies.append(time.perf_counter() - start)
+        candidates = [cls.clean_captcha(c.text) for c in candidates]
+        candidates = [c for c in candidates if len(c) in lens]
+        label = cls.clean_captcha(label)
+        if not candidates:
+            rejects += 1
+        elif candidates[0] == label:
+            correct += 1
+        if label in candidates:
+            hits += 1
+
+    for d, l in samples:
+        await run(d, l)
+    start = time.perf_counter()
+    await asyncio.gather(*[engine.rank(d) for d, _ in samples])
+    spent = time.perf_counter() - start
+    n = len(samples)
+    return (
+        str(n),
+        f"{correct / n:.1%}",
+        f"{hits / n:.1%}",
+        str(rejects),
+        f"{percentile(latencies, 0.5) * 1000:.1f}",
+        f"{percentile(latencies, 0.99) * 1000:.1f}",
+        f"{n / spent:.1f}",
+    )
+
+
+async def benchmarker(config, path):
+    classes = {}
+    subclasses = BotCheckin.__subclasses__()
+    while subclasses:
+        cls = subclasses.pop()
+        subclasses.extend(cls.__subclasses__())
+        classes[cls.__name__] = classes[cls.name] = cls
+    engine = OCR(**{**config.get("ocr", {}), "cache": 0})
+    await engine.preload()
+    columns = [
+        Column("机器人", style="cyan"),
+        Column("样本", justify="right"),
+        Column("准确率", style="green", justify="right"),
+        Column("候选命中", justify="right"),
+        Column("长度不符", style="red", justify="right"),
+        Column("P50 (ms)", justify="right"),
+        Column("P99 (ms)", justify="right"),
+        Column("张/秒", style="yellow", justify="right"),
+    ]
+    table = Table(*columns, header_style="bold magenta", box=box.SIMPLE)
+    try:
+        for d in sorted(p for p in Path(path).iterdir() if p.is_dir()):
+            cls = classes.get(d.name, None)
+            if not cls:
+                logger.warning(f'跳过无法对应签到类的目录: "{d.name}".')
+                continue
+            samples = []
+            for f in sorted(d.iterdir()):
+                if f.suffix.lower() in (".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp"):
+                    samples.append((f.read_bytes(), re.sub(r"_\d+$", "", f.stem)))
+            if not samples:
+                continue
+            logger.info(f'正在测试: "{d.name}" ({len(samples)} 张).')
+            table.add_row(cls.__name__, *await _benchmark(cls, engine, samples))
+    finally:
+        engine.shutdown()
+    Console().print(table)
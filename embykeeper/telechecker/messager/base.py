@@ -62,7 +62,7 @@ class Messager:
                 return self.log.info(f"由于非工作日, 本次发送被跳过.")
         async with ClientsSession([self.account], proxy=self.proxy) as clients:
             async for tg in clients:
-                chat = await tg.get_chat(self.chat_name)
+                chat = await tg.cache.get_chat(self.chat_name)
                 self.log.bind(username=tg.me.first_name).info(
                     f'向聊天 "{chat.title or chat.first_name}" 发送: {message}'
                 )
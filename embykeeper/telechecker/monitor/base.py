@@ -114,17 +114,17 @@ class Monitor:
 
     async def start(self):
         try:
-            chat = await self.client.get_chat(self.chat_name)
+            chat = await self.client.cache.get_chat(self.chat_name)
             self.chat_name = chat.id
         except UsernameNotOccupied:
             self.log.warning(f'初始化错误: 群组 "{self.chat_name}" 不存在.')
             return False
         try:
-            me = await chat.get_member("me")
+            status = await self.client.cache.get_status(chat)
         except UserNotParticipant:
             self.log.warning(f'初始化错误: 尚未加入群组 "{chat.title}".')
             return False
-        if me.status in (ChatMemberStatus.LEFT, ChatMemberStatus.RESTRICTED):
+        if status in (ChatMemberStatus.LEFT, ChatMemberStatus.RESTRICTED):
             self.log.warning(f'初始化错误: 被群组 "{chat.title}" 禁言.')
             return False
         spec = f"[green]{chat.title}[/] [gray50](@{chat.username})[/]"
@@ -0,0 +1,371 @@
+import asyncio
+import hashlib
+import io
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict, namedtuple
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import BinaryIO, List, Optional, Set, Union
+
+from loguru import logger
+from PIL import Image
+
+logger = logger.bind(scheme="telechecker", name="OCR")
+
+_model = None
+_model_lock = threading.Lock()
+_model_threads = 1
+
+Candidate = namedtuple("Candidate", ("text", "confidence"))
+
+ImageData = Union[bytes, bytearray, memoryview, BinaryIO]
+
+
+def _open(data: ImageData) -> Image.Image:
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return Image.open(io.BytesIO(data))
+    data.seek(0)
+    return Image.open(data)
+
+
+def _to_bytes(data: ImageData):
+    if isinstance(data, (bytes, bytearray)):
+        return data
+    elif isinstance(data, memoryview):
+        return data.tobytes()
+    elif isinstance(data, io.BytesIO):
+        return data.getvalue()
+    else:
+        data.seek(0)
+        return data.read()
+
+
+class OCRModel:
+    """ddddocr beta 模型的推理封装, 直接持有 ONNX 会话以控制线程数.
+
+    预处理与 ddddocr 1.6.1 的 OCREngine 保持一致 (先缩放后转灰度, 归一化到 [0, 1]), 升级 ddddocr 时需一并核对."""
+
+    height = 64
+    prune = 5
+
+    def __init__(self, threads=1):
+        import ddddocr
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        options.log_severity_level = 3
+        path = os.path.join(os.path.dirname(ddddocr.__file__), "common.onnx")
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input = self.session.get_inputs()[0].name
+        self.charset = self.load_charset()
+
+    @staticmethod
+    def load_charset():
+        from ddddocr.models.charset_manager import CharsetManager
+
+        manager = CharsetManager()
+        manager.load_default_charset(beta=True)
+        return manager.get_charset()
+
+    def preprocess(self, image: Image.Image):
+        import numpy as np
+
+        width = int(image.size[0] * (self.height / image.size[1]))
+        image = image.resize((width, self.height), Image.LANCZOS).convert("L")
+        tensor = np.empty((1, 1, self.height, width), dtype=np.float32)
+        np.divide(np.asarray(image), 255, out=tensor[0, 0], casting="unsafe")
+        return tensor
+
+    def decode(self, output, k=1) -> List[Candidate]:
+        import numpy as np
+
+        logits = output.reshape(-1, output.shape[-1])
+        probs = np.exp(logits - logits.max(axis=-1, keepdims=True))
+        probs /= probs.sum(axis=-1, keepdims=True)
+        if k <= 1:
+            result = []
+            last = 0
+            for i in probs.argmax(axis=-1):
+                if i != last and i != 0:
+                    result.append(self.charset[i])
+                last = i
+            return [Candidate("".join(result), float(probs.max(axis=-1).prod()))]
+        beams = {(): (1.0, 0.0)}
+        for step in probs:
+            top = set(np.argpartition(step, -self.prune)[-self.prune :].tolist()) | {0}
+            nexts = defaultdict(lambda: [0.0, 0.0])
+            for prefix, (pb, pnb) in beams.items():
+                for c in top:
+                    p = float(step[c])
+                    if c == 0:
+                        nexts[prefix][0] += (pb + pnb) * p
+                    elif prefix and prefix[-1] == c:
+                        nexts[prefix][1] += pnb * p
+                        nexts[prefix + (c,)][1] += pb * p
+                    else:
+                        nexts[prefix + (c,)][1] += (pb + pnb) * p
+            beams = dict(sorted(nexts.items(), key=lambda b: -sum(b[1]))[: k * 2])
+        texts = defaultdict(float)
+        for prefix, (pb, pnb) in beams.items():
+            texts["".join(self.charset[c] for c in prefix)] += pb + pnb
+        return [Candidate(t, p) for t, p in sorted(texts.items(), key=lambda t: -t[1])[:k]]
+
+    def classification(self, data: ImageData, k=1):
+        image = _open(data)
+        output = self.session.run(None, {self.input: self.preprocess(image)})[0]
+        return self.decode(output, k)
+
+
+def _init_worker(threads):
+    global _model_threads
+    _model_threads = threads
+
+
+def _reset_model():
+    global _model
+    with _model_lock:
+        _model = None
+
+
+def _get_model():
+    global _model
+    if not _model:
+        with _model_lock:
+            if not _model:
+                _model = OCRModel(threads=_model_threads)
+    return _model
+
+
+def _classification(data: ImageData, k=1):
+    return _get_model().classification(data, k)
+
+
+def _preload():
+    _get_model()
+
+
+def _fingerprint(data: bytes):
+    try:
+        return CaptchaCache.key(data)
+    except OSError:
+        return None
+
+
+@dataclass
+class CacheEntry:
+    candidates: List[Candidate]
+    expires: float
+    accepted: Optional[str] = None
+    rejected: Set[str] = field(default_factory=set)
+
+    def ranked(self):
+        candidates = [c for c in self.candidates if c.text not in self.rejected]
+        candidates.sort(key=lambda c: c.text != self.accepted)
+        return candidates
+
+
+class CaptchaCache:
+    """以验证码图片感知哈希为键的识别结果缓存 (LRU + TTL), 并记录结果是否被机器人接受."""
+
+    grid = (32, 16)
+
+    def __init__(self, size=1024, ttl=3600):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+
+    @classmethod
+    def key(cls, data: ImageData):
+        w, h = cls.grid
+        image = _open(data)
+        image.draft("L", (w * 4, h * 4))
+        pixels = image.convert("L").resize((w + 1, h), Image.BILINEAR).tobytes()
+        bits = 0
+        for r in range(h):
+            row = pixels[r * (w + 1) : (r + 1) * (w + 1)]
+            for c in range(w):
+                bits = (bits << 1) | (row[c] > row[c + 1])
+        return image.size, bits
+
+    def _get(self, key) -> Optional[CacheEntry]:
+        entry = self.entries.get(key, None)
+        if not entry:
+            return None
+        if entry.expires < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def get(self, key) -> Optional[List[Candidate]]:
+        entry = self._get(key)
+        if entry:
+            return entry.ranked() or None
+
+    def put(self, key, candidates: List[Candidate]):
+        entry = self._get(key)
+        if entry:
+            entry.candidates = candidates
+        else:
+            self.entries[key] = CacheEntry(candidates, time.monotonic() + self.ttl)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def accept(self, key, text: str):
+        entry = self._get(key)
+        if entry:
+            entry.accepted = text
+            entry.rejected.discard(text)
+            entry.expires = time.monotonic() + self.ttl
+
+    def reject(self, key, text: str):
+        entry = self._get(key)
+        if entry:
+            entry.rejected.add(text)
+            if entry.accepted == text:
+                entry.accepted = None
+
+
+class OCR:
+    """验证码识别执行器, 在独立的线程池或进程池中运行推理以避免阻塞事件循环."""
+
+    def __init__(
+        self,
+        workers=2,
+        process=False,
+        threads=1,
+        warmup=5,
+        cache=1024,
+        cache_ttl=3600,
+        candidates=5,
+    ):
+        self.workers = workers
+        self.process = process
+        self.threads = threads
+        self.warmup = warmup
+        self.cache = CaptchaCache(cache, cache_ttl) if cache else None
+        self.candidates = candidates
+        self.executor: Executor = None
+        self._fingerprints = {}
+        self._inflight = {}
+
+    def configure(
+        self,
+        workers=None,
+        process=None,
+        threads=None,
+        warmup=None,
+        cache=None,
+        cache_ttl=None,
+        candidates=None,
+    ):
+        if warmup is not None:
+            self.warmup = warmup
+        if candidates:
+            self.candidates = candidates
+        if cache is not None or cache_ttl is not None:
+            if self.cache and cache != 0:
+                self.cache.size = cache or self.cache.size
+                self.cache.ttl = cache_ttl or self.cache.ttl
+            elif cache != 0:
+                self.cache = CaptchaCache(cache or 1024, cache_ttl or 3600)
+            else:
+                self.cache = None
+        spec = (
+            workers or self.workers,
+            self.process if process is None else process,
+            threads or self.threads,
+        )
+        if spec != (self.workers, self.process, self.threads):
+            self.shutdown()
+            self.workers, self.process, self.threads = spec
+
+    def get_executor(self):
+        if not self.executor:
+            if self.process:
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.threads,),
+                )
+            else:
+                _init_worker(self.threads)
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ocr")
+            logger.debug(
+                f'验证码识别已启动: {self.workers} 个{"进程" if self.process else "线程"}, 每个 {self.threads} 个推理线程.'
+            )
+        return self.executor
+
+    async def preload(self):
+        loop = asyncio.get_running_loop()
+        executor = self.get_executor()
+        jobs = self.workers if self.process else 1
+        await asyncio.gather(*[loop.run_in_executor(executor, _preload) for _ in range(jobs)])
+        logger.debug("验证码识别模型已预加载.")
+
+    @staticmethod
+    def _share(inflight: dict, key, start):
+        """同一键仅运行一个任务, 之后的调用者等待同一结果."""
+        task = inflight.get(key, None)
+        if not task:
+            task = inflight[key] = asyncio.ensure_future(start())
+            task.add_done_callback(lambda _: inflight.pop(key, None))
+        return asyncio.shield(task)
+
+    async def fingerprint(self, data: ImageData):
+        """在识别线程/进程中计算图片感知哈希, 内容相同的并发请求共享同一次计算."""
+        if not self.cache:
+            return None
+        data = _to_bytes(data)
+        loop = asyncio.get_running_loop()
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        start = lambda: loop.run_in_executor(self.get_executor(), _fingerprint, data)
+        return await self._share(self._fingerprints, digest, start)
+
+    async def rank(self, data: ImageData, key=None) -> List[Candidate]:
+        if not (self.cache and key):
+            return await self._infer(data)
+        candidates = self.cache.get(key)
+        if candidates:
+            logger.debug(f'验证码缓存命中: "{candidates[0].text}".')
+            return candidates
+        if key in self._inflight:
+            logger.debug("相同验证码正在识别, 等待结果.")
+        candidates = await self._share(self._inflight, key, lambda: self._infer(data, key))
+        return self.cache.get(key) or candidates
+
+    async def _infer(self, data: ImageData, key=None) -> List[Candidate]:
+        if self.process:
+            data = _to_bytes(data)
+        loop = asyncio.get_running_loop()
+        candidates = await loop.run_in_executor(self.get_executor(), _classification, data, self.candidates)
+        if self.cache and key:
+            self.cache.put(key, candidates)
+        return candidates
+
+    async def recognize(self, data: ImageData, key=None) -> str:
+        candidates = await self.rank(data, key=key)
+        return candidates[0].text if candidates else ""
+
+    def feedback(self, key, text: str, accepted: bool):
+        if self.cache and key:
+            if accepted:
+                self.cache.accept(key, text)
+            else:
+                self.cache.reject(key, text)
+
+    def shutdown(self):
+        if self.executor:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+            _reset_model()
+
+
+ocr = OCR()
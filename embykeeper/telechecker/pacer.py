@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+"""
+发送速率控制: 全局, 账号与会话三级令牌桶, 并集中处理 FloodWait. 下载使用独立的令牌桶, 不占用发送名额.
+"""
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked = 0
+
+    def wait(self, now: float):
+        """返回距离下一个可用令牌的秒数."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return max(self.blocked - now, 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate)
+
+    def take(self):
+        self.tokens -= 1
+
+    def block(self, seconds: float):
+        self.blocked = max(self.blocked, time.monotonic() + seconds)
+
+
+class Pacer:
+    rate = 1
+    burst = 5
+    peer_rate = 1
+    peer_burst = 2
+    download_rate = 2
+    download_burst = 5
+    flood_max = 900
+    bucket = TokenBucket(30, 30)
+    pacers = []
+
+    def __init__(self):
+        self.account = TokenBucket(self.rate, self.burst)
+        self.downloads = TokenBucket(self.download_rate, self.download_burst)
+        self.peers = {}
+        self.depth = 0
+        Pacer.pacers.append(self)
+
+    @staticmethod
+    def key(peer):
+        if peer is None:
+            return None
+        for attr in ("user_id", "chat_id", "channel_id"):
+            value = getattr(peer, attr, None)
+            if value is not None:
+                return attr, value
+        return type(peer).__name__
+
+    @classmethod
+    def total_depth(cls):
+        return sum(p.depth for p in cls.pacers)
+
+    def peer(self, key):
+        bucket = self.peers.get(key, None)
+        if not bucket:
+            bucket = self.peers[key] = TokenBucket(self.peer_rate, self.peer_burst)
+        return bucket
+
+    def block(self, seconds: float, key=None):
+        """因 FloodWait / SlowmodeWait 暂停该账号 (或指定会话) 的发送."""
+        (self.peer(key) if key is not None else self.account).block(seconds)
+
+    async def acquire(self, key=None, download=False):
+        if download:
+            buckets = [self.downloads]
+        else:
+            buckets = [self.bucket, self.account]
+            if key is not None:
+                buckets.append(self.peer(key))
+        self.depth += 1
+        try:
+            while True:
+                now = time.monotonic()
+                wait = max(b.wait(now) for b in buckets)
+                if wait <= 0:
+                    for b in buckets:
+                        b.take()
+                    return
+                await asyncio.sleep(wait)
+        finally:
+            self.depth -= 1
+
+    def close(self):
+        if self in Pacer.pacers:
+            Pacer.pacers.remove(self)
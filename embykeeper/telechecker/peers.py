@@ -0,0 +1,131 @@
+import time
+from typing import Iterable, Union
+
+from loguru import logger
+from pyrogram import raw, types
+from pyrogram.enums import ChatMemberStatus, ChatType
+from pyrogram.errors import RPCError
+from tinydb import Query, TinyDB
+from tinydb.storages import MemoryStorage
+
+logger = logger.bind(scheme="telegram")
+
+USER_FIELDS = ("id", "is_bot", "first_name", "last_name", "username")
+CHAT_FIELDS = ("id", "title", "username", "first_name", "last_name")
+
+
+class PeerCache:
+    """按账号缓存已解析的用户, 会话与成员状态, 跨运行保存在会话文件旁."""
+
+    ttl = 86400
+    member_ttl = 3600
+
+    def __init__(self, client):
+        self.client = client
+        if client.in_memory:
+            self.db = TinyDB(storage=MemoryStorage)
+        else:
+            self.db = TinyDB(client.workdir / f"{client.name}.peers.json")
+        self.entries = {}
+        now = time.time()
+        for doc in self.db.all():
+            if doc["expires"] > now:
+                self.entries[doc["kind"], doc["key"]] = (doc["data"], doc["expires"])
+
+    @staticmethod
+    def key(ident: Union[int, str]):
+        return str(ident).lower().lstrip("@")
+
+    def get(self, kind, ident):
+        entry = self.entries.get((kind, self.key(ident)), None)
+        if entry and entry[1] > time.time():
+            return entry[0]
+
+    def set(self, kind, idents, data, ttl=None):
+        expires = time.time() + (ttl or self.ttl)
+        docs = []
+        for ident in set(self.key(i) for i in idents if i is not None):
+            self.entries[kind, ident] = (data, expires)
+            docs.append({"kind": kind, "key": ident, "data": data, "expires": expires})
+        Q = Query()
+        self.db.remove((Q.kind == kind) & Q.key.one_of([d["key"] for d in docs]))
+        self.db.insert_multiple(docs)
+
+    def drop(self, kind, ident):
+        key = self.key(ident)
+        self.entries.pop((kind, key), None)
+        Q = Query()
+        self.db.remove((Q.kind == kind) & (Q.key == key))
+
+    def _set_user(self, ident, user: types.User):
+        data = {f: getattr(user, f) for f in USER_FIELDS}
+        self.set("user", (ident, user.id, user.username), data)
+        chat = {f: getattr(user, f, None) for f in CHAT_FIELDS}
+        chat["type"] = (ChatType.BOT if user.is_bot else ChatType.PRIVATE).value
+        self.set("chat", (ident, user.id, user.username), chat)
+
+    def _set_chat(self, ident, chat: types.Chat):
+        data = {**{f: getattr(chat, f) for f in CHAT_FIELDS}, "type": chat.type.value}
+        self.set("chat", (ident, chat.id, chat.username), data)
+
+    async def get_user(self, ident: Union[int, str]) -> types.User:
+        data = self.get("user", ident)
+        if data:
+            return types.User(client=self.client, **data)
+        user = await self.client.get_users(ident)
+        self._set_user(ident, user)
+        return user
+
+    async def get_chat(self, ident: Union[int, str]) -> types.Chat:
+        data = self.get("chat", ident)
+        if data:
+            return types.Chat(client=self.client, **{**data, "type": ChatType(data["type"])})
+        chat = await self.client.get_chat(ident)
+        self._set_chat(ident, chat)
+        return chat
+
+    async def get_status(self, chat: types.Chat) -> ChatMemberStatus:
+        """获取自身在群组中的成员状态, 未加入时抛出 UserNotParticipant."""
+        data = self.get("member", chat.id)
+        if data:
+            return ChatMemberStatus(data["status"])
+        member = await chat.get_member("me")
+        self.set("member", (chat.id,), {"status": member.status.value}, ttl=self.member_ttl)
+        return member.status
+
+    async def prefetch(self, idents: Iterable[Union[int, str]]):
+        """批量解析尚未缓存的用户与会话, 每类仅需一次请求."""
+        users, channels, chats = {}, {}, {}
+        for ident in set(idents):
+            if ident is None or self.get("chat", ident):
+                continue
+            try:
+                peer = await self.client.resolve_peer(ident)
+            except (RPCError, KeyError, ValueError) as e:
+                logger.bind(username=self.client.me.first_name).debug(f'无法解析 "{ident}": {e}.')
+                continue
+            if isinstance(peer, raw.types.InputPeerUser):
+                users[peer.user_id] = (ident, raw.types.InputUser(user_id=peer.user_id, access_hash=peer.access_hash))
+            elif isinstance(peer, raw.types.InputPeerChannel):
+                channels[peer.channel_id] = (
+                    ident,
+                    raw.types.InputChannel(channel_id=peer.channel_id, access_hash=peer.access_hash),
+                )
+            elif isinstance(peer, raw.types.InputPeerChat):
+                chats[peer.chat_id] = (ident, peer.chat_id)
+        if users:
+            r = await self.client.invoke(raw.functions.users.GetUsers(id=[u for _, u in users.values()]))
+            for u in r:
+                if isinstance(u, raw.types.User) and u.id in users:
+                    self._set_user(users[u.id][0], types.User._parse(self.client, u))
+        if channels:
+            r = await self.client.invoke(raw.functions.channels.GetChannels(id=[c for _, c in channels.values()]))
+            for c in r.chats:
+                if isinstance(c, raw.types.Channel) and c.id in channels:
+                    self._set_chat(channels[c.id][0], types.Chat._parse_channel_chat(self.client, c))
+        if chats:
+            r = await self.client.invoke(raw.functions.messages.GetChats(id=[c for _, c in chats.values()]))
+            for c in r.chats:
+                if isinstance(c, raw.types.Chat) and c.id in chats:
+                    self._set_chat(chats[c.id][0], types.Chat._parse_chat_chat(self.client, c))
+        return len(users) + len(channels) + len(chats)
@@ -0,0 +1,57 @@
+import asyncio
+import random
+import time
+from collections import defaultdict
+from typing import Hashable, Iterable, Tuple
+
+"""
+签到计划: 在时间窗口内均匀分布各 (账号, 机器人) 签到, 并限制每个机器人与每个账号的并发会话数.
+"""
+
+
+class Planner:
+    def __init__(self, window=0, bot_concurrent=2, account_concurrent=2):
+        self.window = window
+        self.start = time.monotonic()
+        self.offsets = {}
+        self.bot_concurrent = bot_concurrent
+        self.account_concurrent = account_concurrent
+        self.bots = defaultdict(int)
+        self.accounts = defaultdict(int)
+        self.condition = asyncio.Condition()
+
+    def plan(self, pairs: Iterable[Tuple[Hashable, Hashable]]):
+        """将同一机器人的各账号随机排序后分层抖动, 使其在窗口内均匀分布."""
+        self.start = time.monotonic()
+        by_bot = defaultdict(list)
+        for account, bot in pairs:
+            by_bot[bot].append(account)
+        for bot, accounts in by_bot.items():
+            random.shuffle(accounts)
+            n = len(accounts)
+            for i, account in enumerate(accounts):
+                self.offsets[account, bot] = self.window * (i + random.random()) / n
+        return self.offsets
+
+    def wait(self, account: Hashable, bot: Hashable):
+        """距离该签到计划开始时间的秒数."""
+        offset = self.offsets.get((account, bot), 0)
+        return max(0, self.start + offset - time.monotonic())
+
+    def free(self, account: Hashable, bot: Hashable):
+        return self.accounts[account] < self.account_concurrent and self.bots[bot] < self.bot_concurrent
+
+    async def run(self, account: Hashable, bot: Hashable, func, wait=None):
+        """同时获得账号与机器人的并发名额后运行, 等待期间不占用任一名额."""
+        await asyncio.sleep(self.wait(account, bot) if wait is None else wait)
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.free(account, bot))
+            self.accounts[account] += 1
+            self.bots[bot] += 1
+        try:
+            return await func()
+        finally:
+            async with self.condition:
+                self.accounts[account] -= 1
+                self.bots[bot] -= 1
+                self.condition.notify_all()
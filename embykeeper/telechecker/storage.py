@@ -0,0 +1,252 @@
+import asyncio
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, List, Tuple
+
+from loguru import logger
+from pyrogram.storage.sqlite_storage import SQLiteStorage, get_input_peer
+
+from .. import __name__
+
+logger = logger.bind(scheme="telegram")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions
+(
+    account   TEXT PRIMARY KEY,
+    dc_id     INTEGER,
+    api_id    INTEGER,
+    test_mode INTEGER,
+    auth_key  BLOB,
+    date      INTEGER NOT NULL,
+    user_id   INTEGER,
+    is_bot    INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS peers
+(
+    account        TEXT NOT NULL,
+    id             INTEGER NOT NULL,
+    access_hash    INTEGER,
+    type           TEXT NOT NULL,
+    username       TEXT,
+    phone_number   TEXT,
+    last_update_on INTEGER NOT NULL DEFAULT (CAST(STRFTIME('%s', 'now') AS INTEGER)),
+    PRIMARY KEY (account, id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS imported
+(
+    account TEXT PRIMARY KEY
+);
+
+CREATE INDEX IF NOT EXISTS idx_peers_username ON peers (account, username);
+CREATE INDEX IF NOT EXISTS idx_peers_phone_number ON peers (account, phone_number);
+"""
+
+SESSION_FIELDS = ("dc_id", "api_id", "test_mode", "auth_key", "date", "user_id", "is_bot")
+PEER_FIELDS = ("account", "id", "access_hash", "type", "username", "phone_number", "last_update_on")
+
+
+class Database:
+    """多个账号共享的 WAL 模式数据库连接, 节点写入缓存在内存中, 定期以单个短事务批量写入."""
+
+    databases = {}
+    flush_interval = 5
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.conn = sqlite3.connect(str(path), timeout=10, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.ref = 0
+        self.peers = {}
+        self.flusher: asyncio.TimerHandle = None
+
+    @classmethod
+    def acquire(cls, path: Path):
+        path = Path(path).resolve()
+        db = cls.databases.get(path, None)
+        if not db:
+            db = cls.databases[path] = cls(path)
+        db.ref += 1
+        return db
+
+    def release(self):
+        self.ref -= 1
+        if self.ref <= 0:
+            self.databases.pop(self.path, None)
+            self.commit()
+            self.conn.close()
+
+    def defer(self):
+        if self.flusher:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return self.commit()
+        self.flusher = loop.call_later(self.flush_interval, self.commit)
+
+    def commit(self):
+        if self.flusher:
+            self.flusher.cancel()
+            self.flusher = None
+        peers, self.peers = self.peers, {}
+        with self.conn:
+            if peers:
+                self.conn.executemany(
+                    "REPLACE INTO peers (account, id, access_hash, type, username, phone_number, last_update_on)"
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    peers.values(),
+                )
+
+    def pending(self, account: str, **match):
+        for (a, _), p in self.peers.items():
+            if a == account and all(p[PEER_FIELDS.index(k)] == v for k, v in match.items()):
+                return p
+
+
+class SharedStorage(SQLiteStorage):
+    """将所有账号的会话与节点保存在同一数据库中, 首次使用时导入已有的 .session 文件."""
+
+    FILE_NAME = f"{__name__}.sessions.db"
+
+    def __init__(self, name: str, workdir: Path):
+        super().__init__(name)
+        self.workdir = Path(workdir)
+        self.db: Database = None
+
+    async def open(self):
+        self.db = Database.acquire(self.workdir / self.FILE_NAME)
+        self.conn = self.db.conn
+        if not self.conn.execute("SELECT 1 FROM sessions WHERE account = ?", (self.name,)).fetchone():
+            self.create()
+
+    def create(self):
+        legacy = self.workdir / f"{self.name}.session"
+        session = {"dc_id": 2, "date": 0}
+        peers = []
+        imported = self.conn.execute("SELECT 1 FROM imported WHERE account = ?", (self.name,)).fetchone()
+        if legacy.is_file() and not imported:
+            src = sqlite3.connect(str(legacy))
+            try:
+                src.row_factory = sqlite3.Row
+                row = src.execute("SELECT * FROM sessions").fetchone()
+                if row:
+                    session = {k: row[k] for k in row.keys() if k in SESSION_FIELDS}
+                peers = src.execute(
+                    "SELECT id, access_hash, type, username, phone_number, last_update_on FROM peers"
+                ).fetchall()
+            except sqlite3.Error as e:
+                logger.warning(f'导入会话文件 "{legacy}" 失败 ({e}), 将重新登录.')
+                session, peers = {"dc_id": 2, "date": 0}, []
+            else:
+                logger.info(f'已将会话文件 "{legacy.name}" 导入共享会话数据库.')
+            finally:
+                src.close()
+        with self.conn:
+            self.conn.execute(
+                f"INSERT INTO sessions (account, {', '.join(SESSION_FIELDS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.name, *(session.get(f, None) for f in SESSION_FIELDS)),
+            )
+            self.conn.executemany(
+                "REPLACE INTO peers (account, id, access_hash, type, username, phone_number, last_update_on)"
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(self.name, *tuple(p)) for p in peers],
+            )
+            self.conn.execute("INSERT OR IGNORE INTO imported (account) VALUES (?)", (self.name,))
+
+    async def save(self):
+        await self.date(int(time.time()))
+        self.db.commit()
+
+    async def close(self):
+        if self.db:
+            self.db.release()
+            self.db = self.conn = None
+
+    async def delete(self):
+        db = self.db or Database.acquire(self.workdir / self.FILE_NAME)
+        try:
+            for k in [k for k in db.peers if k[0] == self.name]:
+                del db.peers[k]
+            with db.conn:
+                db.conn.execute("DELETE FROM sessions WHERE account = ?", (self.name,))
+                db.conn.execute("DELETE FROM peers WHERE account = ?", (self.name,))
+        finally:
+            if db is not self.db:
+                db.release()
+
+    async def update_peers(self, peers: List[Tuple[int, int, str, str, str]]):
+        now = int(time.time())
+        for p in peers:
+            self.db.peers[self.name, p[0]] = (self.name, *p, now)
+        self.db.defer()
+
+    async def get_peer_by_id(self, peer_id: int):
+        p = self.db.peers.get((self.name, peer_id), None)
+        if p:
+            return get_input_peer(*p[1:4])
+        r = self.conn.execute(
+            "SELECT id, access_hash, type FROM peers WHERE account = ? AND id = ?", (self.name, peer_id)
+        ).fetchone()
+        if r is None:
+            raise KeyError(f"ID not found: {peer_id}")
+        return get_input_peer(*r)
+
+    async def get_peer_by_username(self, username: str):
+        p = self.db.pending(self.name, username=username)
+        if p:
+            return get_input_peer(*p[1:4])
+        r = self.conn.execute(
+            "SELECT id, access_hash, type, last_update_on FROM peers WHERE account = ? AND username = ?"
+            "ORDER BY last_update_on DESC",
+            (self.name, username),
+        ).fetchone()
+        if r is None:
+            raise KeyError(f"Username not found: {username}")
+        if abs(time.time() - r[3]) > self.USERNAME_TTL:
+            raise KeyError(f"Username expired: {username}")
+        return get_input_peer(*r[:3])
+
+    async def get_peer_by_phone_number(self, phone_number: str):
+        p = self.db.pending(self.name, phone_number=phone_number)
+        if p:
+            return get_input_peer(*p[1:4])
+        r = self.conn.execute(
+            "SELECT id, access_hash, type FROM peers WHERE account = ? AND phone_number = ?",
+            (self.name, phone_number),
+        ).fetchone()
+        if r is None:
+            raise KeyError(f"Phone number not found: {phone_number}")
+        return get_input_peer(*r)
+
+    def _field(self, field: str, value: Any = object):
+        if value == object:
+            return self.conn.execute(f"SELECT {field} FROM sessions WHERE account = ?", (self.name,)).fetchone()[0]
+        with self.conn:
+            self.conn.execute(f"UPDATE sessions SET {field} = ? WHERE account = ?", (value, self.name))
+
+    async def dc_id(self, value: int = object):
+        return self._field("dc_id", value)
+
+    async def api_id(self, value: int = object):
+        return self._field("api_id", value)
+
+    async def test_mode(self, value: bool = object):
+        return self._field("test_mode", value)
+
+    async def auth_key(self, value: bytes = object):
+        return self._field("auth_key", value)
+
+    async def date(self, value: int = object):
+        return self._field("date", value)
+
+    async def user_id(self, value: int = object):
+        return self._field("user_id", value)
+
+    async def is_bot(self, value: bool = object):
+        return self._field("is_bot", value)
@@ -1,50 +1,189 @@
 import asyncio
-from typing import AsyncGenerator, Optional
+import time
+from dataclasses import dataclass, field
+from datetime import date
+from typing import AsyncGenerator, Optional, Set
 
 from loguru import logger
 from pyrogram import Client as _Client
 from pyrogram import raw, types, utils
 from pyrogram.enums import SentCodeType
-from pyrogram.errors import BadRequest, PhoneCodeExpired, PhoneCodeInvalid, RPCError, Unauthorized
+from pyrogram.errors import (
+    BadRequest,
+    FloodWait,
+    PhoneCodeExpired,
+    PhoneCodeInvalid,
+    PhoneNumberBanned,
+    PhoneNumberInvalid,
+    RPCError,
+    SlowmodeWait,
+    Unauthorized,
+    UserDeactivated,
+    UserDeactivatedBan,
+)
+from pyrogram.handlers import EditedMessageHandler, MessageHandler, RawUpdateHandler
 
 from .. import __name__, __version__
 from ..utils import to_iterable
+from .pacer import Pacer
+from .peers import PeerCache
+from .storage import SharedStorage
 
 logger = logger.bind(scheme="telegram")
 
 
+class Router:
+    """按 (会话, 发信人) 索引的消息分发器, 每个客户端仅注册一组处理器."""
+
+    group = 1000
+
+    def __init__(self, client: "Client"):
+        self.client = client
+        self.routes = {}
+        self.handlers = [MessageHandler(self.dispatch), EditedMessageHandler(self.dispatch)]
+
+    def add(self, chat_id: int, user_id: int, callback):
+        if not self.routes:
+            for h in self.handlers:
+                self.client.add_handler(h, group=self.group)
+        self.routes.setdefault((chat_id, user_id), []).append(callback)
+
+    def remove(self, chat_id: int, user_id: int, callback):
+        callbacks = self.routes.get((chat_id, user_id), [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+        if not callbacks:
+            self.routes.pop((chat_id, user_id), None)
+        if not self.routes:
+            for h in self.handlers:
+                try:
+                    self.client.remove_handler(h, group=self.group)
+                except ValueError:
+                    pass
+
+    async def dispatch(self, client: "Client", message: types.Message):
+        if not (message.from_user and message.chat):
+            return
+        for callback in tuple(self.routes.get((message.chat.id, message.from_user.id), ())):
+            await callback(client, message)
+
+
 class Client(_Client):
+    archive_group = 999
+    prompt = asyncio.Lock()
+    paced = (
+        raw.functions.messages.SendMessage,
+        raw.functions.messages.SendMedia,
+        raw.functions.messages.SendMultiMedia,
+        raw.functions.messages.ForwardMessages,
+        raw.functions.messages.EditMessage,
+        raw.functions.messages.GetBotCallbackAnswer,
+        raw.functions.messages.RequestWebView,
+    )
+
+    @property
+    def pacer(self) -> Pacer:
+        pacer = getattr(self, "_pacer", None)
+        if not pacer:
+            pacer = self._pacer = Pacer()
+        return pacer
+
+    async def invoke(self, query, *args, **kw):
+        """发送类请求经过速率控制, FloodWait 将暂停该账号的发送并在等待后重试."""
+        key = Pacer.key(getattr(query, "peer", None))
+        paced = isinstance(query, self.paced)
+        waited = 0
+        while True:
+            if paced:
+                await self.pacer.acquire(key)
+            try:
+                return await super().invoke(query, *args, **kw)
+            except (FloodWait, SlowmodeWait) as e:
+                if waited + e.value > self.pacer.flood_max:
+                    raise
+                waited += e.value
+                name = self.me.first_name if self.me else self.name
+                logger.bind(username=name).info(
+                    f"触发 Telegram 频率限制, 将在 {e.value} 秒后重试 (等待队列: {self.pacer.depth})."
+                )
+                if isinstance(e, SlowmodeWait):
+                    self.pacer.block(e.value, key)
+                else:
+                    self.pacer.block(e.value)
+                if not paced:
+                    await asyncio.sleep(e.value)
+
+    async def download_media(self, *args, **kw):
+        await self.pacer.acquire(download=True)
+        return await super().download_media(*args, **kw)
+
+    @property
+    def router(self) -> Router:
+        router = getattr(self, "_router", None)
+        if not router:
+            router = self._router = Router(self)
+        return router
+
+    @property
+    def cache(self) -> PeerCache:
+        cache = getattr(self, "_cache", None)
+        if not cache:
+            cache = self._cache = PeerCache(self)
+        return cache
+
+    async def get_archived(self) -> Set[int]:
+        """获取已归档会话的 ID 集合, 每个客户端仅遍历一次归档, 之后由归档变更更新."""
+        lock = getattr(self, "_archived_lock", None)
+        if not lock:
+            lock = self._archived_lock = asyncio.Lock()
+        async with lock:
+            if getattr(self, "_archived", None) is None:
+                archived = set()
+                async for d in self.get_dialog_peers(folder_id=1):
+                    archived.add(d.id)
+                self._archived = archived
+                self.add_handler(RawUpdateHandler(self._on_folder_peers), group=self.archive_group)
+        return self._archived
+
+    async def _on_folder_peers(self, client, update, users, chats):
+        if isinstance(update, raw.types.UpdateFolderPeers):
+            for p in update.folder_peers:
+                if p.folder_id == 1:
+                    self._archived.add(utils.get_peer_id(p.peer))
+                else:
+                    self._archived.discard(utils.get_peer_id(p.peer))
+
     async def authorize(self):
         if self.bot_token:
             return await self.sign_in_bot(self.bot_token)
-        while True:
-            try:
-                sent_code = await self.send_code(self.phone_number)
-                code_target = {
-                    SentCodeType.APP: "Telegram客户端",
-                    SentCodeType.SMS: "短信",
-                    SentCodeType.CALL: "来电",
-                    SentCodeType.FLASH_CALL: "闪存呼叫",
-                    SentCodeType.FRAGMENT_SMS: "Fragment短信",
-                    SentCodeType.EMAIL_CODE: "邮件",
-                }
-                if not self.phone_code:
-                    self.phone_code = await utils.ainput(
-                        " " * 29 + f'请在{code_target[sent_code.type]}接收"{self.phone_number}"的两步验证码: '
-                    )
-                signed_in = await self.sign_in(self.phone_number, sent_code.phone_code_hash, self.phone_code)
-            except PhoneCodeInvalid or PhoneCodeExpired:
-                pass
-            else:
-                break
+        async with self.prompt:
+            while True:
+                try:
+                    sent_code = await self.send_code(self.phone_number)
+                    code_target = {
+                        SentCodeType.APP: "Telegram客户端",
+                        SentCodeType.SMS: "短信",
+                        SentCodeType.CALL: "来电",
+                        SentCodeType.FLASH_CALL: "闪存呼叫",
+                        SentCodeType.FRAGMENT_SMS: "Fragment短信",
+                        SentCodeType.EMAIL_CODE: "邮件",
+                    }
+                    if not self.phone_code:
+                        self.phone_code = await utils.ainput(
+                            " " * 29 + f'请在{code_target[sent_code.type]}接收"{self.phone_number}"的两步验证码: '
+                        )
+                    signed_in = await self.sign_in(self.phone_number, sent_code.phone_code_hash, self.phone_code)
+                except (PhoneCodeInvalid, PhoneCodeExpired):
+                    self.phone_code = None
+                else:
+                    break
         if isinstance(signed_in, types.User):
             return signed_in
         else:
             raise BadRequest("该账户尚未注册")
 
-    async def get_dialogs(
-        self, limit: int = 0, exclude_pinned=None, folder_id=None
-    ) -> Optional[AsyncGenerator["types.Dialog", None]]:
+    async def _get_dialog_pages(self, limit: int = 0, exclude_pinned=None, folder_id=None):
+        """按页获取原始会话列表, 翻页偏移由原始数据计算, 无需解析消息或解析对端."""
         current = 0
         total = limit or (1 << 31) - 1
         limit = min(100, total)
@@ -69,45 +208,106 @@ class Client(_Client):
 
             users = {i.id: i for i in r.users}
             chats = {i.id: i for i in r.chats}
+            messages = {
+                utils.get_peer_id(m.peer_id): m for m in r.messages if not isinstance(m, raw.types.MessageEmpty)
+            }
+            dialogs = [d for d in r.dialogs if isinstance(d, raw.types.Dialog)][: total - current]
 
-            messages = {}
+            if not dialogs:
+                return
 
-            for message in r.messages:
-                if isinstance(message, raw.types.MessageEmpty):
-                    continue
+            yield dialogs, messages, users, chats
 
-                chat_id = utils.get_peer_id(message.peer_id)
-                messages[chat_id] = await types.Message._parse(self, message, users, chats)
+            current += len(dialogs)
+            if current >= total:
+                return
 
-            dialogs = []
+            last = dialogs[-1]
+            message = messages.get(utils.get_peer_id(last.peer), None)
+            offset_id = last.top_message
+            offset_date = message.date if message else 0
+            offset_peer = self._input_peer(last.peer, users, chats)
 
-            for dialog in r.dialogs:
-                if not isinstance(dialog, raw.types.Dialog):
-                    continue
+    @staticmethod
+    def _input_peer(peer, users, chats):
+        if isinstance(peer, raw.types.PeerUser):
+            user = users.get(peer.user_id, None)
+            return raw.types.InputPeerUser(user_id=peer.user_id, access_hash=getattr(user, "access_hash", 0) or 0)
+        elif isinstance(peer, raw.types.PeerChat):
+            return raw.types.InputPeerChat(chat_id=peer.chat_id)
+        else:
+            channel = chats.get(peer.channel_id, None)
+            return raw.types.InputPeerChannel(
+                channel_id=peer.channel_id, access_hash=getattr(channel, "access_hash", 0) or 0
+            )
 
-                dialogs.append(types.Dialog._parse(self, dialog, messages, users, chats))
+    async def get_dialog_peers(
+        self, limit: int = 0, exclude_pinned=None, folder_id=None
+    ) -> AsyncGenerator["DialogPeer", None]:
+        """轻量遍历会话, 仅返回会话 ID 与标记, 完整的 Dialog 可通过 DialogPeer.parse 按需解析."""
+        async for dialogs, messages, users, chats in self._get_dialog_pages(limit, exclude_pinned, folder_id):
+            for d in dialogs:
+                chat_id = utils.get_peer_id(d.peer)
+                yield DialogPeer(
+                    id=chat_id,
+                    folder_id=d.folder_id or 0,
+                    pinned=bool(d.pinned),
+                    unread_count=d.unread_count,
+                    top_message=d.top_message,
+                    client=self,
+                    dialog=d,
+                    message=messages.get(chat_id, None),
+                    users=users,
+                    chats=chats,
+                )
 
-            if not dialogs:
-                return
+    async def get_dialogs(
+        self, limit: int = 0, exclude_pinned=None, folder_id=None
+    ) -> Optional[AsyncGenerator["types.Dialog", None]]:
+        async for peer in self.get_dialog_peers(limit, exclude_pinned, folder_id):
+            yield await peer.parse()
 
-            last = dialogs[-1]
 
-            offset_id = last.top_message.id
-            offset_date = utils.datetime_to_timestamp(last.top_message.date)
-            offset_peer = await self.resolve_peer(last.chat.id)
+@dataclass
+class DialogPeer:
+    id: int
+    folder_id: int
+    pinned: bool
+    unread_count: int
+    top_message: int
+    client: Client = field(repr=False)
+    dialog: raw.types.Dialog = field(repr=False)
+    message: raw.base.Message = field(repr=False)
+    users: dict = field(repr=False)
+    chats: dict = field(repr=False)
 
-            for dialog in dialogs:
-                yield dialog
+    async def parse(self) -> types.Dialog:
+        messages = {}
+        if self.message:
+            messages[self.id] = await types.Message._parse(self.client, self.message, self.users, self.chats)
+        return types.Dialog._parse(self.client, self.dialog, messages, self.users, self.chats)
 
-                current += 1
 
-                if current >= total:
-                    return
+class Lease:
+    """连接池条目: 登录任务, 借用计数与空闲登出定时器."""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.ref = 0
+        self.expire: asyncio.TimerHandle = None
 
 
 class ClientsSession:
+    """进程内共享的客户端连接池, 各模块借用已登录的客户端, 最后一个借用者归还后保持 keepalive 秒再登出."""
+
     pool = {}
     lock = asyncio.Lock()
+    keepalive = 0
+    shared = False
+    login_concurrent = 8
+    logins: asyncio.Semaphore = None
+    failed = {}
+    latencies = {}
 
     @classmethod
     def from_config(cls, config, **kw):
@@ -123,9 +323,10 @@ class ClientsSession:
         self.done = asyncio.Queue()
         self.tasks = []
 
-    @staticmethod
-    async def login(account, proxy):
+    @classmethod
+    async def login(cls, account, proxy):
         logger.info(f'登录账号 "{account["phone"]}".')
+        retried = False
         try:
             while True:
                 try:
@@ -138,13 +339,23 @@ class ClientsSession:
                         proxy=proxy,
                         lang_code="zh",
                     )
+                    if cls.shared:
+                        client.storage = SharedStorage(client.name, client.workdir)
                     await client.start()
-                except Unauthorized:
+                except Unauthorized as e:
+                    if retried or isinstance(e, (UserDeactivated, UserDeactivatedBan)):
+                        raise
+                    retried = True
+                    logger.info(f'账号 "{account["phone"]}" 的会话已失效, 将重新登录.')
                     await client.storage.delete()
                 except Exception:
                     raise
                 else:
                     break
+        except (Unauthorized, PhoneNumberInvalid, PhoneNumberBanned) as e:
+            message = e.MESSAGE.format(value=e.value)
+            cls.failed[account["phone"]] = (message, date.today())
+            logger.error(f'登录账号 "{client.phone_number}" 失败 ({message}), 今日将被跳过.')
         except RPCError as e:
             logger.error(f'登录账号 "{client.phone_number}" 失败 ({e.MESSAGE.format(value=e.value)}), 将被跳过.')
         except Exception as e:
@@ -152,51 +363,151 @@ class ClientsSession:
         else:
             return client
 
+    @classmethod
+    async def limited_login(cls, account, proxy):
+        """限制同时登录的账号数, 并记录每个账号的登录耗时."""
+        phone = account["phone"]
+        failed = cls.failed.get(phone, None)
+        if failed:
+            message, day = failed
+            if day == date.today():
+                logger.warning(f'账号 "{phone}" 今日登录失败 ({message}), 跳过.')
+                return None
+            del cls.failed[phone]
+        if not cls.logins:
+            cls.logins = asyncio.Semaphore(cls.login_concurrent)
+        async with cls.logins:
+            start = time.perf_counter()
+            client = await cls.login(account, proxy)
+            cls.latencies[phone] = (time.perf_counter() - start, time.perf_counter())
+        if client:
+            logger.debug(f'账号 "{phone}" 登录耗时 {cls.latencies[phone][0]:.2f} 秒.')
+        return client
+
+    @classmethod
+    async def borrow(cls, account, proxy=None) -> Optional[Client]:
+        """从连接池借用客户端, 尚未登录时登录, 同一账号的并发借用共享同一次登录."""
+        phone = account["phone"]
+        async with cls.lock:
+            lease = cls.pool.get(phone, None)
+            if not lease:
+                lease = cls.pool[phone] = Lease(asyncio.create_task(cls.limited_login(account, proxy)))
+            lease.ref += 1
+            if lease.expire:
+                lease.expire.cancel()
+                lease.expire = None
+        try:
+            client = await asyncio.shield(lease.task)
+        except asyncio.CancelledError:
+            if lease.task.done():
+                await cls.release(phone)
+            else:
+                async with cls.lock:
+                    lease.ref -= 1
+                    if not lease.ref and cls.pool.get(phone, None) is lease:
+                        cls.pool.pop(phone)
+                        lease.task.cancel()
+            raise
+        if not client:
+            async with cls.lock:
+                lease.ref -= 1
+                if cls.pool.get(phone, None) is lease:
+                    cls.pool.pop(phone)
+        return client
+
+    @classmethod
+    async def release(cls, phone):
+        """归还客户端, 无借用者时在 keepalive 秒后登出."""
+        async with cls.lock:
+            lease = cls.pool.get(phone, None)
+            if not lease:
+                return
+            lease.ref -= 1
+            if lease.ref > 0:
+                return
+            if cls.keepalive:
+                loop = asyncio.get_running_loop()
+                lease.expire = loop.call_later(cls.keepalive, lambda: loop.create_task(cls.expire(phone, lease)))
+                return
+            cls.pool.pop(phone)
+        await cls.logout(lease.task.result())
+
+    @classmethod
+    async def expire(cls, phone, lease: Lease):
+        async with cls.lock:
+            if lease.ref or cls.pool.get(phone, None) is not lease:
+                return
+            cls.pool.pop(phone)
+        await cls.logout(lease.task.result())
+
+    @classmethod
+    async def shutdown(cls):
+        """登出连接池中的所有客户端."""
+        async with cls.lock:
+            leases = list(cls.pool.values())
+            cls.pool.clear()
+        for lease in leases:
+            if lease.expire:
+                lease.expire.cancel()
+            if not lease.task.done():
+                lease.task.cancel()
+            elif not lease.task.cancelled():
+                await cls.logout(lease.task.result())
+
+    @staticmethod
+    async def logout(client: Client):
+        if not client:
+            return
+        logger.info(f"正在登出: {client.me.first_name}.")
+        try:
+            await client.stop(block=True)
+        except ConnectionError:
+            pass
+        finally:
+            client.pacer.close()
+
     async def loginer(self, account):
-        client = await self.login(account, self.proxy)
+        client = await self.borrow(account, self.proxy)
         if isinstance(client, Client):
-            async with self.lock:
-                phone = account["phone"]
-                self.pool[phone] = (client, 1)
-                self.phones.append(phone)
-                await self.done.put(client)
+            self.phones.append(account["phone"])
+        await self.done.put(client)
 
     async def __aenter__(self):
+        self.start = time.perf_counter()
         for a in self.accounts:
-            async with self.lock:
-                phone = a["phone"]
-                if phone in self.pool:
-                    client, ref = self.pool[phone]
-                    ref += 1
-                    self.pool[ref] = (client, ref)
-                    await self.done.put(client)
-                else:
-                    self.pool[phone] = None
-                    self.tasks.append(asyncio.create_task(self.loginer(a)))
+            self.tasks.append(asyncio.create_task(self.loginer(a)))
         return self
 
     def __aiter__(self):
         async def aiter():
             for _ in range(len(self.accounts)):
-                yield await self.done.get()
+                client = await self.done.get()
+                if client:
+                    yield client
+            self.report()
 
         return aiter()
 
+    def report(self):
+        """汇总本次新登录账号的耗时."""
+        latencies = {}
+        for a in self.accounts:
+            spent, finished = self.latencies.get(a["phone"], (None, 0))
+            if finished >= self.start:
+                latencies[a["phone"]] = spent
+        if len(latencies) < 2:
+            return
+        slowest = max(latencies, key=latencies.get)
+        median = sorted(latencies.values())[len(latencies) // 2]
+        logger.info(
+            f"已登录 {len(self.phones)}/{len(self.accounts)} 个账号, 用时 {time.perf_counter() - self.start:.1f} 秒 "
+            f'(中位 {median:.1f} 秒, 最慢 "{slowest}" {latencies[slowest]:.1f} 秒).'
+        )
+
     async def __aexit__(self, type, value, tb):
+        for t in self.tasks:
+            t.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
         for phone in self.phones:
-            async with self.lock:
-                entry = self.pool.get(phone, None)
-                if not entry:
-                    continue
-                client, ref = entry
-                ref -= 1
-                if ref:
-                    self.pool[phone] = (client, ref)
-                else:
-                    logger.info(f"正在登出: {client.me.first_name}.")
-                    try:
-                        await client.stop(block=True)
-                    except ConnectionError:
-                        pass
-                    finally:
-                        self.pool.pop(phone, "None")
+            await self.release(phone)
+        self.phones.clear()
@@ -88,3 +88,8 @@ def batch(iterable, n=1):
 
 def flatten(l):
     return [item for sublist in l for item in sublist]
+
+
+def percentile(values: Iterable, q: float):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))] if values else 0